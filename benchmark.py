@@ -0,0 +1,272 @@
+'''
+Throughput benchmarks for the cube models and the blindfold trainer.
+
+Run with no arguments to print results; use --output to also save them as
+JSON, and --compare to show the change relative to an earlier JSON file:
+
+    python benchmark.py --output before.json
+    ... change things ...
+    python benchmark.py --compare before.json
+'''
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+import blindfold_cycles_trainer
+import cube_cubies_take2
+import cube_stickers
+
+
+########################################
+# Driver code
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark parsing, moves, rendering and trainer replay.')
+    parser.add_argument('--output', '-o', metavar='FILE',
+        help='write results to FILE as JSON')
+    parser.add_argument('--compare', '-c', metavar='FILE',
+        help='compare against results previously written with --output')
+    parser.add_argument('--min-time', type=float, default=0.2,
+        help='minimum seconds to spend timing each benchmark, not counting '
+            'calibration (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='seed for the random scrambles and memos')
+    parser.add_argument('--only', metavar='SUBSTRING',
+        help='only run benchmarks whose names contain SUBSTRING')
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.min_time, args.seed, args.only)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['benchmarks']
+
+    for name, result in results['benchmarks'].items():
+        line = f'{name:32} {formatRate(result["opsPerSec"]):>14} ' \
+            f'{result["unit"]}/s'
+        if baseline is not None and name in baseline:
+            ratio = result['opsPerSec'] / baseline[name]['opsPerSec']
+            line += f'   {ratio:6.2f}x'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+def formatRate(opsPerSec):
+    if opsPerSec >= 1e6:
+        return f'{opsPerSec / 1e6:.2f}M'
+    if opsPerSec >= 1e3:
+        return f'{opsPerSec / 1e3:.2f}k'
+    return f'{opsPerSec:.2f}'
+
+
+########################################
+# Benchmarks
+#
+# Each benchmark is a function taking a random.Random and returning
+# (func, unitsPerCall, unit); func is what gets timed, and its throughput is
+# reported in units per second.
+
+SCRAMBLE_LENGTH = 25
+NUM_SCRAMBLES   = 100
+
+# Memo lengths typical of a full solve
+EDGE_MEMO_LENGTH   = 12
+CORNER_MEMO_LENGTH = 8
+
+def _withSuffixes(letters):
+    return [letter + suffix for letter in letters for suffix in ['', '2', "'"]]
+
+_faceMoves = _withSuffixes('RLUDFB')
+
+def randomScramble(rng, length=SCRAMBLE_LENGTH):
+    # Avoid turning the same face twice in a row, as real scramblers do.
+    moves = []
+    while len(moves) < length:
+        move = rng.choice(_faceMoves)
+        if not moves or moves[-1][0] != move[0]:
+            moves.append(move)
+    return ' '.join(moves)
+
+def randomMemo(rng, setupMoves, length):
+    return ''.join(rng.choice(sorted(setupMoves)) for _ in range(length))
+
+def benchScrambleCold(rng):
+    # Distinct scrambles each time, so every call has to parse and compile.
+    scrambles = [randomScramble(rng) for _ in range(NUM_SCRAMBLES)]
+    def run():
+        cube_cubies_take2.clearAlgorithmCache()
+        cube = cube_cubies_take2.Cube()
+        for scramble in scrambles:
+            cube.doMoves(scramble)
+    return run, NUM_SCRAMBLES * SCRAMBLE_LENGTH, 'moves'
+
+def benchScrambleWarm(rng):
+    # The same scrambles over and over, as when replaying a fixed set.
+    scrambles = [randomScramble(rng) for _ in range(NUM_SCRAMBLES)]
+    def run():
+        cube = cube_cubies_take2.Cube()
+        for scramble in scrambles:
+            cube.doMoves(scramble)
+    return run, NUM_SCRAMBLES * SCRAMBLE_LENGTH, 'moves'
+
+def _benchMoveType(moves):
+    def bench(rng):
+        sequence = [rng.choice(moves) for _ in range(NUM_SCRAMBLES)]
+        def run():
+            cube = cube_cubies_take2.Cube()
+            for move in sequence:
+                cube.doOneMove(move)
+        return run, len(sequence), 'moves'
+    return bench
+
+def benchRepr(rng):
+    cube = cube_cubies_take2.Cube()
+    cube.doMoves(randomScramble(rng))
+    return lambda: repr(cube), 1, 'renders'
+
+def benchStickersRotateFace(rng):
+    faces = [rng.randrange(6) for _ in range(NUM_SCRAMBLES)]
+    def run():
+        cube = cube_stickers.Cube()
+        for face in faces:
+            cube.rotateFace(face)
+    return run, len(faces), 'moves'
+
+def benchCopyBranch(rng):
+    # Branch off copies of one position, trying a move on each, as a search
+    # does.
+    cube = cube_cubies_take2.Cube()
+    cube.doMoves(randomScramble(rng))
+    moves = [rng.choice(_faceMoves) for _ in range(NUM_SCRAMBLES)]
+    def run():
+        for move in moves:
+            branch = cube.copy()
+            branch.doOneMove(move)
+    return run, len(moves), 'copies'
+
+def _randomMemos(rng):
+    trainer = blindfold_cycles_trainer
+    return [
+        (randomMemo(rng, trainer.edgeSetupMoves, EDGE_MEMO_LENGTH),
+            randomMemo(rng, trainer.cornerSetupMoves, CORNER_MEMO_LENGTH))
+        for _ in range(10)]
+
+def benchTrainerReplay(rng):
+    # One letter at a time, as the interactive trainer does
+    trainer = blindfold_cycles_trainer
+    memos = _randomMemos(rng)
+    def run():
+        for edges, corners in memos:
+            cube = cube_cubies_take2.Cube()
+            for letter in edges:
+                trainer.doEdge(cube, letter)
+            cube.doMoves(trainer.PARITY)
+            for letter in corners:
+                trainer.doCorner(cube, letter)
+    return run, len(memos), 'memos'
+
+def benchTrainerReplayComposed(rng):
+    trainer = blindfold_cycles_trainer
+    memos = _randomMemos(rng)
+    def run():
+        for edges, corners in memos:
+            cube = cube_cubies_take2.Cube()
+            trainer.doEdges(cube, edges)
+            cube.doMoves(trainer.PARITY)
+            trainer.doCorners(cube, corners)
+    return run, len(memos), 'memos'
+
+BENCHMARKS = {
+    'doMoves.scramble.cold'  : benchScrambleCold,
+    'doMoves.scramble.warm'  : benchScrambleWarm,
+    'doOneMove.face'         : _benchMoveType(_faceMoves),
+    'doOneMove.wide'         : _benchMoveType(
+        _withSuffixes(['Rw', 'Lw', 'Uw', 'Dw', 'Fw', 'Bw'])),
+    'doOneMove.slice'        : _benchMoveType(_withSuffixes('MES')),
+    'doOneMove.rotation'     : _benchMoveType(_withSuffixes('xyz')),
+    'Cube.__repr__'          : benchRepr,
+    'Cube.copy.branch'       : benchCopyBranch,
+    'stickers.rotateFace'    : benchStickersRotateFace,
+    'trainer.replay'         : benchTrainerReplay,
+    'trainer.replay.composed': benchTrainerReplayComposed,
+}
+
+def runBenchmarks(minTime, seed, only=None):
+    benchmarks = {}
+    for name, bench in BENCHMARKS.items():
+        if only and only not in name:
+            continue
+        func, unitsPerCall, unit = bench(random.Random(seed))
+        secondsPerCall = timeCall(func, minTime)
+        benchmarks[name] = {
+            'secondsPerCall' : secondsPerCall,
+            'opsPerSec'      : unitsPerCall / secondsPerCall,
+            'unit'           : unit,
+        }
+    return {
+        'benchmarks' : benchmarks,
+        'meta'       : environmentInfo(seed),
+    }
+
+# Timing is split into at least this many runs, of which the fastest counts,
+# so that one interruption can't skew the result.
+MIN_REPEATS = 3
+
+def timeCall(func, minTime):
+    '''
+    Return the best observed seconds per call of func, timing it for at
+    least minTime seconds in total, in at least MIN_REPEATS runs. (A func
+    slower than minTime / MIN_REPEATS still gets one call per run, so takes
+    longer.)
+    '''
+    timer = timeit.Timer(func)
+    # Warm up (and let any caches fill) before timing anything.
+    func()
+    # Find how many calls make a run take about minTime / MIN_REPEATS,
+    # growing the number at most tenfold at a time so as not to overshoot.
+    # timeit.Timer.autorange would make every run take at least 0.2 s,
+    # whatever minTime is.
+    perRun = minTime / MIN_REPEATS
+    number = 1
+    elapsed = timer.timeit(number)
+    while elapsed < perRun:
+        number = max(number + 1,
+            int(number * min(10, perRun / max(elapsed, 1e-9))))
+        elapsed = timer.timeit(number)
+    repeats = max(MIN_REPEATS, int(minTime / elapsed))
+    return min([elapsed] + timer.repeat(repeat=repeats - 1,
+        number=number)) / number
+
+def environmentInfo(seed):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit'    : commit,
+        'python'    : sys.version.split()[0],
+        'numpy'     : np.__version__,
+        'platform'  : platform.platform(),
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'seed'      : seed,
+    }
+
+
+########################################
+
+if __name__ == '__main__':
+    main()
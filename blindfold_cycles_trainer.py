@@ -1,11 +1,61 @@
-from cube_cubies_take2 import Cube
+import collections
+import csv
+import functools
+import json
+import os
+import sys
+
+import numpy as np
+
+from cube_algorithms import invert
+from cube_cubies_take2 import (
+    Algorithm, Cube, CubeBatch, Transform, faceletIndex, frameRelativeStates,
+    homeFaceletStates, transformStates)
+from cube_io import openInput, readLines
+import table_cache
 
 def main():
+    import argparse
     import logging
     #logging.basicConfig(level=logging.INFO)
     #logging.basicConfig(level=logging.DEBUG)
 
+    parser = argparse.ArgumentParser(
+        description='Check a blindfold memo by executing it on a cube.')
+    parser.add_argument('--stats', action='store_true',
+        help='print move counts and timings when done')
+    parser.add_argument('--batch', metavar='FILE',
+        help='instead of asking interactively, check every record (scramble, '
+            'edges, parity, corners) in FILE, or stdin if FILE is -')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+        help='format of the batch file (default: csv if FILE ends in .csv, '
+            'else jsonl)')
+    parser.add_argument('--workers', type=int, default=None,
+        help='number of worker processes for --batch (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=256,
+        help='records per task sent to a worker (default %(default)s)')
+    parser.add_argument('--answers', metavar='FILE',
+        help='instead of asking interactively, read scrambles (one per line) '
+            'from FILE, or stdin if FILE is -, and write the memo for each '
+            'as a JSONL record that --batch accepts')
+    parser.add_argument('--self-test', action='store_true',
+        help='check that the trainer works, then exit')
+    args = parser.parse_args()
+
+    if args.self_test:
+        selfTest()
+        return
+
+    if args.batch is not None:
+        batchMain(args.batch, args.format, args.workers, args.chunk_size)
+        return
+    if args.answers is not None:
+        answersMain(args.answers)
+        return
+
     cube = Cube()
+    if args.stats:
+        cube.enableStats()
 
     print("Enter your scramble:")
     scramble = input("> ")
@@ -20,41 +70,130 @@ def main():
     parity = input("> ")
     print("Corners?")
     corners = input("> ")
+    try:
+        parity = parseParity(parity)
+    except ValueError as e:
+        print(e)
+        return
 
-    for letter in edges:
-        if not letter.isspace():
-            doEdge(cube, letter)
-            logging.info("Edge: %s\n%s", letter, cube)
+    # Keep the history, so that if the memo turns out wrong we can step
+    # back to find where. Each step is (stage, index, letter, the history
+    # position before the letter), as findFirstBadLetter expects.
+    cube.enableHistory()
+    steps = []
+
+    for index, letter in enumerate(edges.replace(" ", "")):
+        steps.append(("edges", index, letter, cube.history.position))
+        doEdge(cube, letter)
+        logging.info("Edge: %s\n%s", letter, cube)
 
     print("\nCube after edges:")
     print(cube)
 
-    if parity in "yY1":
-        # Yes parity
-        cube.doMoves(PARITY)
-    elif parity in "nN0":
-        # No parity
-        pass
-    else:
-        print(f"Unknown parity: {parity}")
-        return
+    steps.append(("parity", 0, "y" if parity else "n",
+        cube.history.position))
+    if parity:
+        cube.doMoves(_compiledAlgorithms()["parityAlgorithm"])
 
     print("\nCube after parity:")
     print(cube)
 
-    for letter in corners:
-        if not letter.isspace():
-            doCorner(cube, letter)
-            logging.info("Corner: %s\n%s", letter, cube)
+    for index, letter in enumerate(corners.replace(" ", "")):
+        steps.append(("corners", index, letter, cube.history.position))
+        doCorner(cube, letter)
+        logging.info("Corner: %s\n%s", letter, cube)
 
     print("\nCube after corners:")
     print(cube)
 
-    # Not implemented
-    #if cube.isCanonical():
-    #    print("\nSuccessfully solved")
-    #else:
-    #    print("\nNot solved!")
+    if cube.stats is not None:
+        print("\nStats:")
+        print(cube.stats)
+
+    if cube.isSolved():
+        print("\nSuccessfully solved")
+        return
+
+    print("\nNot solved!")
+    badStep = findFirstBadLetter(cube, steps)
+    if badStep is None:
+        print("Every letter was a correct target, and the parity right; "
+            "check whether the memo is complete.")
+    elif badStep[0] == "parity":
+        numEdges = len(edges.replace(" ", ""))
+        print(f"The parity answer ({badStep[2]}) is wrong after {numEdges} "
+            "edge letters. The cube just after them:")
+        print(cube)
+    else:
+        stage, index, letter, _ = badStep
+        print(f"The first wrong letter is {letter} ({stage}, letter "
+            f"{index + 1}). The cube just before it:")
+        print(cube)
+
+def selfTest():
+    # A wrong parity answer is reported as such, both stepping back through
+    # the history and checking as we go.
+    cube = Cube()
+    cube.doMoves("R U R' U'")
+    cube.enableHistory()
+    steps = []
+    for index, letter in enumerate("JA"):
+        steps.append(("edges", index, letter, cube.history.position))
+        doEdge(cube, letter)
+    steps.append(("parity", 0, "y", cube.history.position))
+    cube.doMoves(_compiledAlgorithms()["parityAlgorithm"])
+    for index, letter in enumerate("QCKJ"):
+        steps.append(("corners", index, letter, cube.history.position))
+        doCorner(cube, letter)
+    assert not cube.isSolved()
+    assert findFirstBadLetter(cube, steps) == steps[2]
+    assert checkMemo(_cubeAfter("R U R' U'"), "JA", True, "QCKJ") == \
+        ("parity", 0, "y")
+    assert checkMemo(_cubeAfter("R U R' U'"), "JA", False, "QCKJ") is None
+
+    # Extracted memos solve the cube, even when the scramble moves the
+    # centers, and checkRecord agrees.
+    scrambles = ["", "R U R' U'", "M2 E2 S2", "R U F' L2 D B R' U2 F D' L B2",
+        "D B2 D L2 U R2 L2 U' B2 F2 L F' U B D B R2 L U L' B'",
+        "x R", "y R", "R U Rw", "R U F' x y", "Fw R2 M' Uw D' S"]
+    batch = CubeBatch(len(scrambles))
+    batch.doMovesPerCube(scrambles)
+    for scramble, edges, parity, corners in zip(scrambles,
+            *extractMemoArrays(batch.states)):
+        cube = _cubeAfter(scramble)
+        doEdges(cube, edges.decode("ascii"))
+        if parity:
+            cube.doMoves(_compiledAlgorithms()["parityAlgorithm"])
+        doCorners(cube, corners.decode("ascii"))
+        assert cube.isSolved()
+    for scramble in scrambles:
+        edges, parity, corners = extractMemo(_cubeAfter(scramble))
+        assert checkRecord({"scramble" : scramble, "edges" : edges,
+            "parity" : parity, "corners" : corners})["solved"]
+    assert extractMemo(_cubeAfter("R U R' U'")) == ("JA", False, "QCKJ")
+    assert extractMemo(_cubeAfter("y R")) == extractMemo(_cubeAfter("R"))
+    result = checkRecord({"scramble" : "x R", "edges" : "JVT",
+        "parity" : "y", "corners" : "BJVTB"})
+    assert result["solved"], result
+    result = checkRecord({"scramble" : "x R", "edges" : "JVX",
+        "parity" : "y", "corners" : "BJVTB"})
+    assert (result["failedStage"], result["failedIndex"],
+        result["failedLetter"]) == ("edges", 2, "X")
+
+    # Records that can't be checked get an error of their own, rather than
+    # stopping the batch; and parity answers must be one of the known ones.
+    for record in ['{"scramble": ', '[1]', '{"edges": "D"}',
+            {"scramble": "R", "edges": 5}, {"scramble": "R", "parity": ""},
+            {"scramble": "R", "parity": "yY"}]:
+        result = checkRecord(record)
+        assert result["error"] and not result["solved"], record
+    assert checkRecord('{"scramble": "R U R\' U\'", "edges": "JA", '
+        '"parity": "N", "corners": "QCKJ"}')["solved"]
+
+def _cubeAfter(moves):
+    cube = Cube()
+    cube.doMoves(moves)
+    return cube
 
 ########################################
 
@@ -65,9 +204,8 @@ EDGE_SWAP = "R U R' U' R' F R2 U' R' U' R U R' F'"
 PARITY = "(R U' R' U') (R U R D) (R' U' R D') (R' U2' R') U'"
 CORNER_SWAP = "R U' R' U' R U R' F' R U R' U' R' F R"
 
-# Each sticker letter maps to (next sticker, move to get there, move to get
-# back).
-# TODO function to automatically invert an algorithm.
+# Each sticker letter maps to (next sticker, move to get there). The moves to
+# get back are worked out by inverting those.
 # The target maps to (None, "")
 edgeSetupMoves = {
     # B and M are the buffer piece; you don't swap with it
@@ -75,40 +213,40 @@ edgeSetupMoves = {
     #"M" : ___,
 
     # D is the target sticker; it needs no setup
-    "D" : (None, "", ""),
+    "D" : (None, ""),
 
     # Stickers around the left slice are one L turn to target
-    "R" : ("D", "L" , "L'"),
-    "X" : ("D", "L2", "L2"),
-    "L" : ("D", "L'", "L" ),
+    "R" : ("D", "L"),
+    "X" : ("D", "L2"),
+    "L" : ("D", "L'"),
 
     # Stickers on the bottom are one D turn to "X"
-    "W" : ("X", "D" , "D'"),
-    "V" : ("X", "D2", "D2"),
-    "U" : ("X", "D'", "D" ),
+    "W" : ("X", "D"),
+    "V" : ("X", "D2"),
+    "U" : ("X", "D'"),
 
     # Stickers on the E slice are one Dw turn from the sides of the left face
-    "N" : ("R", "Dw" , "Dw'"),
-    "J" : ("R", "Dw2", "Dw2"),
-    "F" : ("R", "Dw'", "Dw" ),
-    "H" : ("L", "Dw" , "Dw'"),
-    "T" : ("L", "Dw2", "Dw2"),
-    "P" : ("L", "Dw'", "Dw" ),
+    "N" : ("R", "Dw"),
+    "J" : ("R", "Dw2"),
+    "F" : ("R", "Dw'"),
+    "H" : ("L", "Dw"),
+    "T" : ("L", "Dw2"),
+    "P" : ("L", "Dw'"),
 
     # Stickers on the M slice are one Lw turn from the bottom face
-    "K" : ("W", "Lw" , "Lw'"),
-    "C" : ("W", "Lw2", "Lw2"),
-    "Q" : ("W", "Lw'", "Lw" ),
-    "I" : ("U", "Lw" , "Lw'"),
-    "A" : ("U", "Lw2", "Lw2"),
-    "S" : ("U", "Lw'", "Lw" ),
+    "K" : ("W", "Lw"),
+    "C" : ("W", "Lw2"),
+    "Q" : ("W", "Lw'"),
+    "I" : ("U", "Lw"),
+    "A" : ("U", "Lw2"),
+    "S" : ("U", "Lw'"),
 
     # E and G can be moved to the E slice with an L turn
-    "E" : ("F", "L", "L'"),
-    "G" : ("H", "L", "L'"),
+    "E" : ("F", "L"),
+    "G" : ("H", "L"),
 
     # O just sucks. It's the only one that needs 4 moves to get to the target.
-    "O" : ("S", "D", "D'"),
+    "O" : ("S", "D"),
 }
 
 cornerSetupMoves = {
@@ -118,67 +256,502 @@ cornerSetupMoves = {
     #"R" : ___,
 
     # Target
-    "V" : (None, "", ""),
+    "V" : (None, ""),
 
     # D turn to target
-    "U" : ("V", "D" , "D'"),
-    "X" : ("V", "D2", "D2"),
-    "W" : ("V", "D'", "D" ),
+    "U" : ("V", "D"),
+    "X" : ("V", "D2"),
+    "W" : ("V", "D'"),
 
     # R turn
-    "T" : ("V", "R" , "R'"),
-    "B" : ("V", "R2", "R2"),
-    "J" : ("V", "R'", "R" ),
+    "T" : ("V", "R"),
+    "B" : ("V", "R2"),
+    "J" : ("V", "R'"),
 
-    "Q" : ("W", "R" , "R'"),
-    "C" : ("W", "R2", "R2"),
-    "K" : ("W", "R'", "R" ),
+    "Q" : ("W", "R"),
+    "C" : ("W", "R2"),
+    "K" : ("W", "R'"),
 
     # F turn
-    "M" : ("V", "F" , "F'"),
-    "D" : ("V", "F2", "F2"),
-    "G" : ("V", "F'", "F" ),
+    "M" : ("V", "F"),
+    "D" : ("V", "F2"),
+    "G" : ("V", "F'"),
 
-    "P" : ("U", "F" , "F'"),
+    "P" : ("U", "F"),
     # Could also do C -> U here
-    "F" : ("U", "F'", "F" ),
+    "F" : ("U", "F'"),
 
     # D turn to reduce to other layer
-    "S" : ("G", "D" , "D'"),
-    "O" : ("G", "D2", "D2"),
+    "S" : ("G", "D"),
+    "O" : ("G", "D2"),
 
-    "H" : ("T", "D'", "D" ),
-    "L" : ("T", "D2", "D2"),
+    "H" : ("T", "D'"),
+    "L" : ("T", "D2"),
 
     # FR and RF
-    "I" : ("J", "F" , "F'"),
-    "N" : ("M", "R'", "R" ),
+    "I" : ("J", "F"),
+    "N" : ("M", "R'"),
 }
 
 def doEdge(cube, letter):
-    setupAlg, cleanupAlg = getSetupAlgs(edgeSetupMoves, letter)
-    cube.doMoves(setupAlg)
-    cube.doMoves(EDGE_SWAP)
-    cube.doMoves(cleanupAlg)
+    cube.doMoves(_compiledAlgorithms()["edgeAlgorithms"][letter])
 
 def doCorner(cube, letter):
-    setupAlg, cleanupAlg = getSetupAlgs(cornerSetupMoves, letter)
-    cube.doMoves(setupAlg)
-    cube.doMoves(CORNER_SWAP)
-    cube.doMoves(cleanupAlg)
+    cube.doMoves(_compiledAlgorithms()["cornerAlgorithms"][letter])
+
+def doEdges(cube, memo):
+    '''
+    Execute a whole edge memo (whitespace is ignored) as a single transform.
+    '''
+    cube.doMoves(memoAlgorithm(memo, _compiledAlgorithms()["edgeAlgorithms"]))
+
+def doCorners(cube, memo):
+    '''
+    Execute a whole corner memo (whitespace is ignored) as a single
+    transform.
+    '''
+    cube.doMoves(memoAlgorithm(memo,
+        _compiledAlgorithms()["cornerAlgorithms"]))
+
+def memoAlgorithm(memo, letterAlgorithms):
+    '''
+    Compose the precompiled algorithms for each letter of memo into one.
+    '''
+    return Algorithm.concatenate(letterAlgorithms[letter]
+        for letter in memo if not letter.isspace())
 
 def getSetupAlgs(setupMoveTable, startLetter):
     setupAlg   = []
     cleanupAlg = []
     currLetter = startLetter
     while True:
-        currLetter, nextSetup, nextCleanup = setupMoveTable[currLetter]
+        currLetter, nextSetup = setupMoveTable[currLetter]
         if currLetter is None:
             break
         setupAlg.append(nextSetup)
-        cleanupAlg = [nextCleanup] + cleanupAlg
+        cleanupAlg = [invert(nextSetup)] + cleanupAlg
     return (setupAlg, cleanupAlg)
 
+# Bump this whenever the cached letter transforms would come out different
+# for the same setup moves and swap algorithm.
+TABLE_VERSION = 1
+
+def compileLetterAlgorithms(setupMoveTable, swapAlg, name=None):
+    '''
+    Return a dict mapping each letter in setupMoveTable to a single compiled
+    Algorithm for its setup, swapAlg, and cleanup. If name is given, the
+    composed transforms are cached on disk under it (see table_cache), so
+    later runs skip composing them.
+    '''
+    letters = sorted(setupMoveTable)
+    letterMoves = {}
+    for letter in letters:
+        setupAlg, cleanupAlg = getSetupAlgs(setupMoveTable, letter)
+        letterMoves[letter] = setupAlg + [swapAlg] + cleanupAlg
+    if name is None:
+        return {letter: Algorithm(letterMoves[letter]) for letter in letters}
+
+    def build():
+        # transforms[i] -> (perm, twist) for letters[i]; every entry is
+        # under 27, so they all fit in bytes.
+        return [[t.perm, t.twist] for t in
+            (Algorithm(letterMoves[letter]).transform for letter in letters)]
+    transforms = np.asarray(table_cache.loadTable('trainer-' + name,
+        TABLE_VERSION, build, (len(letters), 2, 27), np.uint8,
+        [setupMoveTable, swapAlg]))
+    return {letter: Algorithm.precompiled(letterMoves[letter],
+            Transform(transform[0].astype(np.intp), transform[1]))
+        for letter, transform in zip(letters, transforms)}
+
+@functools.lru_cache(maxsize=None)
+def _compiledAlgorithms():
+    # Compiled once, so executing a letter costs about as much as a single
+    # move; but only on first use, so that starting up stays quick.
+    return {
+        "edgeAlgorithms"   : compileLetterAlgorithms(edgeSetupMoves,
+            EDGE_SWAP, "edge-transforms"),
+        "cornerAlgorithms" : compileLetterAlgorithms(cornerSetupMoves,
+            CORNER_SWAP, "corner-transforms"),
+        "parityAlgorithm"  : Algorithm(PARITY),
+    }
+
+def __getattr__(name):
+    # edgeAlgorithms, cornerAlgorithms and parityAlgorithm look like plain
+    # module attributes, but are only compiled when first used.
+    algorithms = _compiledAlgorithms()
+    if name in algorithms:
+        return algorithms[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+########################################
+# Lettering
+#
+# Speffz lettering: each face gets four letters for its edge stickers and four
+# for its corner stickers, going clockwise from the top (top-left, for
+# corners) as the face is drawn in the net, with the faces in ULFRBD order.
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWX"
+
+def _letterFacelets(coords):
+    # Note that ULFRBD is also the order of the F_* constants.
+    return {letter: faceletIndex(i // 4, *coords[i % 4])
+        for i, letter in enumerate(LETTERS)}
+
+edgeLetterFacelets   = _letterFacelets([(0, 1), (1, 2), (2, 1), (1, 0)])
+cornerLetterFacelets = _letterFacelets([(0, 0), (0, 2), (2, 2), (2, 0)])
+
+# The stickers of each buffer piece. Each letter of a memo names where the
+# sticker currently on the first one should go.
+EDGE_BUFFER   = "BM"
+CORNER_BUFFER = "EAR"
+
+def checkLetter(cube, letter, letterFacelets, buffer):
+    '''
+    Return whether letter is a correct next target for the given buffer, in
+    the cube's current state. As for extractMemo, stickers belong with the
+    centers wherever those are now.
+    '''
+    target = letterFacelets.get(letter)
+    if target is None or letter in buffer:
+        return False
+    homes = homeFaceletStates(frameRelativeStates(cube.cubies.reshape(-1)))
+    bufferHome = homes[letterFacelets[buffer[0]]]
+    if bufferHome in [letterFacelets[other] for other in buffer]:
+        # The buffer holds its own piece, so this is a cycle break: any
+        # sticker that isn't already solved will do.
+        return homes[target] != target
+    return bufferHome == target
+
+def checkParity(edges, parity):
+    '''
+    Return whether parity (a bool) is the right answer for whether to do
+    the parity algorithm after the given edge memo. Each edge letter swaps
+    two corners as well, so it's needed after an odd number of them, to
+    swap those back before the corners (which are memorized as if they'd
+    never moved).
+    '''
+    return parity == (len(edges.replace(" ", "")) % 2 == 1)
+
+_stageLetters = {
+    "edges"   : (edgeLetterFacelets,   EDGE_BUFFER),
+    "corners" : (cornerLetterFacelets, CORNER_BUFFER),
+}
+
+def findFirstBadLetter(cube, steps):
+    '''
+    Step back through the history of a cube that a memo was executed on, to
+    find where it went wrong. steps lists (stage, index, letter, position)
+    for each letter executed, in order, where position is how many moves of
+    cube.history had been done just before it. The parity answer is a step
+    too, ("parity", 0, "y" or "n", position), between the edges and the
+    corners. Return the first step whose letter wasn't a correct target (see
+    checkLetter), or whose parity answer was wrong (see checkParity), leaving
+    the cube as it was just before that step; or return None if every step
+    was right.
+    '''
+    end = cube.history.position
+    edges = "".join(letter for stage, _, letter, _ in steps
+        if stage == "edges")
+    for step in steps:
+        stage, index, letter, position = step
+        cube.goToMove(position)
+        if stage == "parity":
+            if not checkParity(edges, letter == "y"):
+                return step
+            continue
+        letterFacelets, buffer = _stageLetters[stage]
+        if not checkLetter(cube, letter, letterFacelets, buffer):
+            return step
+    cube.goToMove(end)
+    return None
+
+########################################
+# Memo extraction
+#
+# To find the memo for a scrambled cube, we execute it as we go. While the
+# buffer holds another piece's sticker, the next letter is where that sticker
+# belongs. When it holds its own piece, the cycle is finished, and the next
+# letter is the first unsolved sticker in alphabetical order, which starts a
+# new cycle (this also takes care of pieces flipped or twisted in place).
+# Doing each letter's algorithm gives the state for the next letter, just as
+# the trainer would. All of this is done for a whole array of cubes at once,
+# with table lookups per cube, so it's fast enough for millions of
+# scrambles.
+#
+# Letters name stickers by where they are now, and a sticker belongs on the
+# face whose center is its color, so a cube whose centers have moved (by a
+# rotation, or a wide or slice move) is traced relative to its frame (see
+# frameRelativeStates).
+
+def _buildMemoTables(letterFacelets, buffer, letterAlgorithms):
+    # Targets are numbered in alphabetical order; number len(targets) means
+    # "none" (the buffer's own piece, or the memo being finished), and has
+    # the identity as its algorithm.
+    targets = sorted(letterAlgorithms)
+    transforms = [letterAlgorithms[letter].transform for letter in targets] + \
+        [Transform.identity()]
+    targetOfFacelet = np.full(max(letterFacelets.values()) + 1, len(targets),
+        dtype=np.intp)
+    for target, letter in enumerate(targets):
+        targetOfFacelet[letterFacelets[letter]] = target
+    return {
+        "facelets"        : np.array([letterFacelets[buffer[0]]] +
+            [letterFacelets[letter] for letter in targets]),
+        "targetOfFacelet" : targetOfFacelet,
+        "letters"         : np.frombuffer(
+            ("".join(targets) + "\0").encode("ascii"), dtype=np.uint8),
+        "perms"           : np.array([t.perm for t in transforms],
+            dtype=np.intp),
+        "twists"          : np.array([t.twist for t in transforms],
+            dtype=np.uint8),
+    }
+
+@functools.lru_cache(maxsize=None)
+def _memoTables():
+    # (edge tables, corner tables), built on first use
+    algorithms = _compiledAlgorithms()
+    return (
+        _buildMemoTables(edgeLetterFacelets, EDGE_BUFFER,
+            algorithms["edgeAlgorithms"]),
+        _buildMemoTables(cornerLetterFacelets, CORNER_BUFFER,
+            algorithms["cornerAlgorithms"]),
+    )
+
+# Cubes traced at a time by extractMemoArrays, to keep temporaries in cache
+MEMO_CHUNK_SIZE = 8192
+
+def _traceMemo(states, tables):
+    '''
+    Execute memos on an (N, 27) array of flat states, working out each
+    letter as we go. Return the states afterwards, and an (N, L) array of
+    the letters as ASCII bytes, padded with zeros.
+    '''
+    facelets = tables["facelets"]
+    targetFacelets = facelets[1:]
+    none = len(targetFacelets)
+    columns = []
+    # Every letter either solves a piece or starts a cycle on an unsolved
+    # one, so this many letters is always enough.
+    for _ in range(2 * none):
+        bufferHomes = homeFaceletStates(states, facelets[:1])[:, 0]
+        targets = tables["targetOfFacelet"][bufferHomes]
+        cycleBreaks = np.flatnonzero(targets == none)
+        unsolved = homeFaceletStates(states[cycleBreaks], targetFacelets) != \
+            targetFacelets
+        targets[cycleBreaks] = np.where(unsolved.any(axis=1),
+            unsolved.argmax(axis=1), none)
+        if (targets == none).all():
+            break
+        columns.append(tables["letters"][targets])
+        states = transformStates(states, tables["perms"][targets],
+            tables["twists"][targets])
+    letters = np.zeros((len(states), len(columns)), dtype=np.uint8)
+    if columns:
+        letters[:] = np.stack(columns, axis=1)
+    return states, letters
+
+def extractMemoArrays(states):
+    '''
+    Work out the memos for an (N, 27) array of flat cube states (as in
+    CubeBatch.states). Return (edges, parity, corners): edges and corners
+    are arrays of the memo letters as bytes strings (see memoStrings), and
+    parity is a boolean array. Doing the edges, then the parity algorithm
+    where parity is true, then the corners solves each cube.
+    '''
+    states = np.asarray(states, dtype=np.uint8).reshape(-1, 27)
+    edgeTables, cornerTables = _memoTables()
+    parityTransform = _compiledAlgorithms()["parityAlgorithm"].transform
+    results = []
+    for start in range(0, len(states), MEMO_CHUNK_SIZE):
+        chunk = frameRelativeStates(states[start:start + MEMO_CHUNK_SIZE])
+        chunk, edges = _traceMemo(chunk, edgeTables)
+        # Each edge letter swaps two corners as well, so an odd number of
+        # them leaves the corners with the wrong parity.
+        parity = (edges != 0).sum(axis=1) % 2 == 1
+        chunk[parity] = parityTransform.apply(chunk[parity])
+        _, corners = _traceMemo(chunk, cornerTables)
+        results.append((memoStrings(edges), parity, memoStrings(corners)))
+    if not results:
+        empty = np.zeros(0, dtype="S1")
+        return empty, np.zeros(0, dtype=bool), empty
+    edges, parity, corners = zip(*results)
+    return (np.concatenate(edges), np.concatenate(parity),
+        np.concatenate(corners))
+
+def memoStrings(letters):
+    '''
+    Turn an (N, L) array of zero-padded ASCII letters into an array of N
+    bytes strings.
+    '''
+    letters = np.ascontiguousarray(letters, dtype=np.uint8)
+    width = max(letters.shape[1], 1)
+    padded = np.zeros((len(letters), width), dtype=np.uint8)
+    padded[:, :letters.shape[1]] = letters
+    return padded.view(f"S{width}").reshape(-1)
+
+def extractMemo(cube):
+    '''
+    Return the memo (edges, parity, corners) for a cube, as for checkMemo:
+    edges and corners are strings of letters, and parity is a bool.
+    '''
+    edges, parity, corners = extractMemoArrays(cube.cubies.reshape(1, 27))
+    return (edges[0].decode("ascii"), bool(parity[0]),
+        corners[0].decode("ascii"))
+
+########################################
+# Batch mode
+
+def checkMemo(cube, edges, parity, corners):
+    '''
+    Execute a memo on a scrambled cube, checking each letter before doing it.
+    Stop at the first wrong letter and return (stage, index, letter) for it,
+    where stage is "edges" or "corners"; a wrong parity answer gives
+    ("parity", 0, "y" or "n"). Return None if every letter was right.
+    parity is a bool.
+    '''
+    stages = [
+        ("edges",   edges,   edgeLetterFacelets,   EDGE_BUFFER,   doEdge),
+        ("corners", corners, cornerLetterFacelets, CORNER_BUFFER, doCorner),
+    ]
+    for stage, memo, letterFacelets, buffer, doLetter in stages:
+        if stage == "corners":
+            if not checkParity(edges, parity):
+                return ("parity", 0, "y" if parity else "n")
+            if parity:
+                cube.doMoves(_compiledAlgorithms()["parityAlgorithm"])
+        for index, letter in enumerate(memo.replace(" ", "")):
+            if not checkLetter(cube, letter, letterFacelets, buffer):
+                return (stage, index, letter)
+            doLetter(cube, letter)
+    return None
+
+# The answers parseParity accepts, in lower case
+_parityAnswers = {
+    "y" : True,  "yes" : True,  "true"  : True,  "1" : True,
+    "n" : False, "no"  : False, "false" : False, "0" : False,
+}
+
+def parseParity(parity):
+    if isinstance(parity, bool):
+        return parity
+    answer = _parityAnswers.get(str(parity).strip().lower())
+    if answer is None:
+        raise ValueError(f"Unknown parity: {parity!r}")
+    return answer
+
+def checkRecord(record):
+    '''
+    Check one batch record: a dict with keys "scramble", "edges", "parity",
+    and "corners", or a JSON object holding them as a string (a line of a
+    JSONL file). Return a dict describing the outcome; a record that can't
+    be checked at all gets an "error" instead.
+    '''
+    result = {
+        "solved"       : False,
+        "failedStage"  : None,
+        "failedIndex"  : None,
+        "failedLetter" : None,
+        "error"        : None,
+    }
+    try:
+        if isinstance(record, str):
+            record = json.loads(record)
+        if not isinstance(record, dict):
+            raise TypeError(f"Expected an object, not {record!r}")
+        for key in ["scramble", "edges", "corners"]:
+            if not isinstance(record.get(key) or "", str):
+                raise TypeError(f"Expected a string for {key}, not "
+                    f"{record[key]!r}")
+        cube = Cube()
+        cube.doMoves(record["scramble"])
+        failure = checkMemo(cube, record.get("edges") or "",
+            parseParity(record.get("parity", "n")),
+            record.get("corners") or "")
+    except (KeyError, TypeError, ValueError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    if failure is not None:
+        (result["failedStage"], result["failedIndex"],
+            result["failedLetter"]) = failure
+    result["solved"] = failure is None and cube.isSolved()
+    return result
+
+def checkRecords(records):
+    return [checkRecord(record) for record in records]
+
+def readRecords(path, format=None):
+    '''
+    Yield records from a JSONL or CSV file, or stdin if path is "-", for
+    checkRecord. A CSV file needs a header row naming the columns, and gives
+    dicts. A JSONL file gives its lines unparsed, so that checkRecord can
+    report a malformed one as that record's error without stopping the
+    batch.
+    '''
+    if format is None:
+        format = "csv" if path.endswith(".csv") else "jsonl"
+    if format == "csv":
+        with openInput(path, newline="") as f:
+            yield from csv.DictReader(f)
+    else:
+        yield from readLines(path)
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def runBatch(records, workers=None, chunkSize=256):
+    '''
+    Check records across a pool of worker processes, yielding results in the
+    same order as the records. Records are read lazily and sent to the
+    workers in chunks, with only a few chunks in flight at a time.
+    '''
+    if workers == 1:
+        for records in _chunks(records, chunkSize):
+            yield from checkRecords(records)
+        return
+
+    # Imported here since it's slow to import, and only needed for this.
+    import concurrent.futures
+    maxPending = 2 * (workers or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for chunk in _chunks(records, chunkSize):
+            pending.append(executor.submit(checkRecords, chunk))
+            if len(pending) >= maxPending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def answersMain(path):
+    for scrambles in _chunks(readLines(path), MEMO_CHUNK_SIZE):
+        batch = CubeBatch(len(scrambles))
+        batch.doMovesPerCube(scrambles)
+        edges, parity, corners = extractMemoArrays(batch.states)
+        for record in zip(scrambles, edges, parity, corners):
+            print(json.dumps({
+                "scramble" : record[0],
+                "edges"    : record[1].decode("ascii"),
+                "parity"   : "y" if record[2] else "n",
+                "corners"  : record[3].decode("ascii"),
+            }))
+
+def batchMain(path, format, workers, chunkSize):
+    numSolved = 0
+    numRecords = 0
+    results = runBatch(readRecords(path, format), workers, chunkSize)
+    for index, result in enumerate(results):
+        result = dict(index=index, **result)
+        print(json.dumps(result))
+        numRecords += 1
+        numSolved += result["solved"]
+    print(f"{numSolved} of {numRecords} solved", file=sys.stderr)
+
 ########################################
 
 if __name__ == '__main__':
@@ -0,0 +1,319 @@
+'''
+Manipulating algorithms as sequences of moves, without a cube.
+'''
+
+import functools
+import re
+
+from cube_cubies_take2 import (
+    Algorithm, Cube, F_U, F_L, F_F, F_R, F_B, F_D, MT_FACE, MT_WIDE,
+    MT_SLICE, MT_ROTATION, Transform, allMoveNames, getAlgorithm, invertMove,
+    isSolvedStates, parseMove, splitAlg)
+
+
+########################################
+# Driver code / self-tests
+
+def main():
+    selfTest()
+
+def selfTest():
+    assert optimize("R U L D D' L' U' R2") == "R'"
+    assert optimize("R L R'") == "L"
+    assert optimize("R M'") == "Rw"
+    assert optimize("R R'") == ""
+    assert optimize("x R x'", removeRotations=True) == "R"
+
+    assert expandBrackets("[R, U]") == ["R", "U", "R'", "U'"]
+    assert expandBrackets("F [R U: [R', F]]") == \
+        "F R U R' F R F' U' R'".split()
+    assert invert("R U2 F'") == "F U2 R'"
+    assert order("R") == 4
+    assert order("R U") == 105
+
+
+########################################
+# Layer vectors
+#
+# All the moves about one axis commute with each other, and together they
+# just turn each of the three layers on that axis by some amount. So a run
+# of moves about one axis can be described by a vector of three quarter-turn
+# counts (mod 4): for the layer next to the axis's reference face (U, L, or
+# F), the middle layer, and the layer next to the opposite face, each
+# counted clockwise as seen from the reference face.
+
+_axisFaces = [(F_U, F_D), (F_L, F_R), (F_F, F_B)]
+_faceAxis = {face: axis
+    for axis, faces in enumerate(_axisFaces)
+    for face in faces}
+
+# Which layers each type of move turns, as seen from the face it's about
+_moveTypeLayers = {
+    MT_FACE     : (1, 0, 0),
+    MT_WIDE     : (1, 1, 0),
+    MT_SLICE    : (0, 1, 0),
+    MT_ROTATION : (1, 1, 1),
+}
+
+def moveVector(move):
+    '''
+    Return (axis, vector) for a single move: the axis (0-2) it turns about,
+    and the quarter turns (mod 4) of each layer on that axis.
+    '''
+    moveType, face, numTurns = parseMove(move)
+    return _layerVector(moveType, face, numTurns)
+
+def _layerVector(moveType, face, numTurns):
+    axis = _faceAxis[face]
+    layers = _moveTypeLayers[moveType]
+    if face != _axisFaces[axis][0]:
+        # Seen from the other side: the layers are reversed, and clockwise
+        # is counterclockwise.
+        layers = layers[::-1]
+        numTurns = -numTurns
+    return axis, tuple(numTurns * layer % 4 for layer in layers)
+
+def _addVectors(a, b):
+    return tuple((x + y) % 4 for x, y in zip(a, b))
+
+_ZERO = (0, 0, 0)
+
+# Preference between equally short ways to write a vector
+_moveTypePriority = [MT_FACE, MT_SLICE, MT_WIDE, MT_ROTATION]
+
+@functools.lru_cache(maxsize=None)
+def _vectorMoves(moveTypes):
+    '''
+    Return vectorMoves[axis][vector] -> a shortest list of move names (of
+    the given types, a tuple) that turns the layers by vector. Built on
+    first use, since most programs never optimize an algorithm.
+    '''
+    generators = [[] for _ in _axisFaces]
+    for move in allMoveNames():
+        # Skip the alternate spellings: lowercase face letters (which this
+        # notation treats as plain face turns) and "2'".
+        if move[0] in 'rludfb' or move.endswith("2'"):
+            continue
+        moveType, face, numTurns = parseMove(move)
+        if moveType in moveTypes:
+            axis, vector = _layerVector(moveType, face, numTurns)
+            generators[axis].append(
+                (_moveTypePriority.index(moveType), move, vector))
+
+    # Breadth-first search from the zero vector, trying the generators in
+    # order of preference.
+    vectorMoves = []
+    for axisGenerators in generators:
+        axisGenerators.sort(key=lambda generator: generator[0])
+        found = {_ZERO: []}
+        frontier = [_ZERO]
+        while frontier:
+            nextFrontier = []
+            for vector in frontier:
+                for _, move, step in axisGenerators:
+                    newVector = _addVectors(vector, step)
+                    if newVector not in found:
+                        found[newVector] = found[vector] + [move]
+                        nextFrontier.append(newVector)
+            frontier = nextFrontier
+        vectorMoves.append(found)
+    return vectorMoves
+
+
+########################################
+# Whole-cube rotations
+#
+# To get rid of a rotation, we move it to the end of the algorithm: doing a
+# rotation and then turning some face is the same as first turning the face
+# that the rotation brings there, and then rotating. So as we go, we keep
+# track of faceMap[face], the face that the rotations so far have brought to
+# where face is.
+
+def _rotationFaceMap(face, numTurns):
+    cube = Cube()
+    cube.rotateWholeCube(face, numTurns)
+    currentFaces = cube.currentFaces()
+    faceMap = [None] * len(currentFaces)
+    for original, current in enumerate(currentFaces):
+        faceMap[current] = original
+    return faceMap
+
+_rotationFaceMaps = {(face, numTurns): _rotationFaceMap(face, numTurns)
+    for face in _faceAxis
+    for numTurns in range(4)}
+
+
+########################################
+# Optimization
+
+def optimize(moves, removeRotations=False):
+    '''
+    Return a shorter algorithm (as a string of moves) that does the same
+    thing as moves (a string, list of strings, or Algorithm).
+
+    Runs of moves about the same axis, which all commute, are merged into a
+    shortest equivalent sequence; moves that cancel out disappear, and as
+    they do, the moves on either side of them are merged too. So for
+    example "R U L D D' L' U' R2" becomes "R'", and "R L R'" becomes "L".
+    Slice, wide and rotation moves take part too, so "R M'" can become
+    "Rw".
+
+    If removeRotations is true, whole-cube rotations are moved to the end of
+    the algorithm (renaming the moves they pass) and then dropped, and wide
+    and slice moves are first split into face turns and a rotation, so the
+    result only uses face turns. The cube then ends up the same as after
+    moves, except possibly for a whole-cube rotation.
+    '''
+    if isinstance(moves, Algorithm):
+        moves = moves.moves
+    return _optimizeCached(' '.join(splitAlg(moves)), bool(removeRotations))
+
+@functools.lru_cache(maxsize=4096)
+def _optimizeCached(normalizedMoves, removeRotations):
+    # Face turns alone can only produce vectors with nothing in the middle
+    # layer, which is all that's left once rotations are split off.
+    vectorMoves = _vectorMoves((MT_FACE,) if removeRotations else
+        tuple(_moveTypePriority))
+    faceMap = list(range(len(_faceAxis)))
+    # Each entry is [axis, vector]; adjacent entries are about different
+    # axes, and none has a zero vector.
+    stack = []
+    for move in splitAlg(normalizedMoves):
+        moveType, face, numTurns = parseMove(move)
+        if removeRotations:
+            axis, vector = _layerVector(moveType, faceMap[face], numTurns)
+            # Split off the middle layer's turn as a rotation, and move it
+            # to the end.
+            middle = vector[1]
+            if middle:
+                rotationMap = _rotationFaceMaps[(_axisFaces[axis][0], middle)]
+                faceMap = [rotationMap[f] for f in faceMap]
+                vector = _addVectors(vector, (-middle,) * 3)
+        else:
+            axis, vector = _layerVector(moveType, face, numTurns)
+
+        if vector == _ZERO:
+            continue
+        if stack and stack[-1][0] == axis:
+            vector = _addVectors(stack[-1][1], vector)
+            if vector == _ZERO:
+                stack.pop()
+            else:
+                stack[-1][1] = vector
+        else:
+            stack.append([axis, vector])
+
+    return ' '.join(move
+        for axis, vector in stack
+        for move in vectorMoves[axis][vector])
+
+
+########################################
+# Algebra
+#
+# Commutators and conjugates are written in the usual bracket notation:
+# [A, B] means A B A' B', and [A: B] means A B A'. Brackets can be nested, and
+# mixed with plain moves and grouping parentheses, as in "F [R, U] F'" or
+# "[R U: [R', F]]".
+
+_bracketTokenRe = re.compile(r"[\[\]:,()]|[^\s\[\]:,()]+")
+
+def expandBrackets(moves):
+    '''
+    Return the list of moves described by a string in bracket notation.
+    '''
+    tokens = _bracketTokenRe.findall(moves)
+    result, end = _parseSequence(tokens, 0, moves)
+    if end != len(tokens):
+        raise ValueError(f'Unexpected {tokens[end]!r} in {moves!r}')
+    return result
+
+def _parseSequence(tokens, i, text):
+    # Parse moves, groups and brackets until something that ends a sequence
+    # (":", ",", "]", ")", or the end). Return (moves, index of that token).
+    result = []
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '(':
+            group, i = _parseSequence(tokens, i + 1, text)
+            _expect(tokens, i, ')', text)
+            result.extend(group)
+            i += 1
+        elif token == '[':
+            first, i = _parseSequence(tokens, i + 1, text)
+            if i >= len(tokens) or tokens[i] not in (':', ','):
+                raise ValueError(f'Expected ":" or "," in bracket in {text!r}')
+            separator = tokens[i]
+            second, i = _parseSequence(tokens, i + 1, text)
+            _expect(tokens, i, ']', text)
+            i += 1
+            if separator == ':':
+                result.extend(first + second + invertMoves(first))
+            else:
+                result.extend(first + second + invertMoves(first) +
+                    invertMoves(second))
+        elif token in (':', ',', ']', ')'):
+            break
+        else:
+            parseMove(token)
+            result.append(token)
+            i += 1
+    return result, i
+
+def _expect(tokens, i, token, text):
+    if i >= len(tokens) or tokens[i] != token:
+        raise ValueError(f'Expected {token!r} in {text!r}')
+
+def invertMoves(moves):
+    '''
+    Return the list of moves that undoes a list of moves.
+    '''
+    return [invertMove(move) for move in reversed(moves)]
+
+def invert(moves):
+    '''
+    Return the inverse of an algorithm (anything Cube.doMoves accepts) as a
+    string of moves.
+    '''
+    if isinstance(moves, Algorithm):
+        moves = moves.moves
+    return ' '.join(invertMoves(splitAlg(moves)))
+
+def conjugate(setup, moves):
+    '''
+    Return [setup: moves], that is setup moves setup', as a string.
+    '''
+    setup = splitAlg(setup)
+    return ' '.join(setup + splitAlg(moves) + invertMoves(setup))
+
+def commutator(a, b):
+    '''
+    Return [a, b], that is a b a' b', as a string.
+    '''
+    a = splitAlg(a)
+    b = splitAlg(b)
+    return ' '.join(a + b + invertMoves(a) + invertMoves(b))
+
+def order(moves):
+    '''
+    Return how many times the algorithm has to be done, starting from a
+    solved cube, before the cube is solved again (as Cube.isSolved sees it:
+    ignoring whole-cube rotations and twisted centers).
+    '''
+    # Doing it transform.order() times certainly gets back to solved, and the
+    # repeat counts that give a solved cube are exactly the multiples of the
+    # smallest one. So the answer is the smallest divisor of the full order
+    # that works.
+    transform = getAlgorithm(moves).transform
+    fullOrder = transform.order()
+    solved = Transform.identity().twist
+    for divisor in range(1, fullOrder + 1):
+        if fullOrder % divisor == 0 and \
+                isSolvedStates(transform.power(divisor).apply(solved)):
+            return divisor
+
+
+########################################
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
+import functools
+import itertools
 import logging
+import math
 import numpy as np
 import re  # Now we have two problems
+import time
+
+import table_cache
 
 
 ########################################
@@ -33,6 +39,96 @@ def selfTest():
     assert getCubieFDR(makeCubie(C_O, C_B)) == (C_O, C_B, C_Y)
     assert getCubieFDR(makeCubie(C_G, C_Y)) == (C_G, C_Y, C_R)
 
+    assert len(_enumerateOrientations()) == NUM_ORIENTATIONS
+    assert _orientationCubies[CANONICAL_ORIENTATION] == CANONICAL_CUBIE
+    for orientation in range(NUM_ORIENTATIONS):
+        for face in _faceToLetter:
+            once = _rotateOrientation[orientation, face, 1]
+            assert _rotateOrientation[once, face, 3] == orientation
+            quarterTurn = _rotateOrientation[CANONICAL_ORIENTATION, face, 1]
+            assert _orientationProduct[quarterTurn, orientation] == once
+
+    # Copies share their state until one changes, and an assigned state is
+    # copied rather than changed in place.
+    cube = Cube()
+    copy = cube.copy()
+    assert not cube.cubies.flags.writeable
+    copy.doMoves('R')
+    assert cube.isSolved() and not copy.isSolved()
+    cube.cubies = copy.cubies
+    cube.doMoves("R'")
+    assert cube.isSolved() and not copy.isSolved()
+    shared = copy.copy()
+    del copy
+    assert shared.cubies.flags.writeable
+
+    # Undoing and redoing moves, across checkpoints
+    cube = Cube()
+    cube.enableHistory(checkpointInterval=4)
+    cube.doMoves("R U R' U' F2 D L'")
+    cube.undo(7)
+    assert cube.isSolved()
+    cube.redo(5)
+    expected = Cube()
+    expected.doMoves("R U R' U' F2")
+    assert cube.toFacelets() == expected.toFacelets()
+    cube.undo(2)
+    cube.doMoves("B")
+    assert len(cube.history) == 4
+
+    # Facelets round-trip, as strings and as nets, even for rotated cubes
+    cube = Cube()
+    cube.doMoves("R U F' L2 D B R' U2 x y")
+    assert Cube.fromFacelets(cube.toFacelets()).toFacelets() == \
+        cube.toFacelets()
+    assert Cube.fromFacelets(repr(cube)).toFacelets() == cube.toFacelets()
+    solved = Cube().toFacelets()
+    def faceletError(changes):
+        # The error code for solved with the stickers at some indices
+        # replaced by the stickers from others
+        facelets = list(solved)
+        for target, source in changes.items():
+            facelets[target] = solved[source]
+        return parseFaceletArray(faceletArray([''.join(facelets)]))[1][0]
+    assert faceletError({}) == FE_OK
+    assert faceletError({4: 22, 22: 4}) == FE_CENTERS           # U, F centers
+    assert faceletError({7: 19, 19: 7}) == FE_FLIP              # UF flipped
+    assert faceletError({8: 9, 9: 20, 20: 8}) == FE_TWIST       # URF twisted
+    assert faceletError({7: 5, 19: 10, 5: 7, 10: 19}) == FE_PARITY
+    assert faceletError({5: 7, 10: 19}) == FE_DUPLICATE         # two UFs
+    assert faceletError({19: 7}) == FE_PIECES                   # a UU edge
+    assert parseFaceletArray(faceletArray(['X' + solved[1:]]))[1][0] == \
+        FE_LETTERS
+    assert list(parseFaceletArray(faceletArray([solved, '\u00dc' +
+        solved[1:]]))[1]) == [FE_OK, FE_LETTERS]
+    try:
+        Cube.fromFacelets('\u00dc' + solved[1:])
+        assert False
+    except ValueError:
+        pass
+
+    # Compact states round-trip, leaving out whole-cube rotations
+    compact = CompactCube.fromCube(cube)
+    assert compact.toCube().stateKey() == cube.stateKey()
+    assert (compactStates(expandCompactStates(compact.toArray())) ==
+        compact.toArray()).all()
+    assert CompactCube(compact.pieces) == compact
+    assert len({compact, CompactCube(compact.pieces)}) == 1
+    assert CompactCube.fromCube(Cube()).isSolved()
+    assert not compact.isSolved()
+
+    # Positions that are mirror images or rotations of each other have the
+    # same canonical key, whether reduced one at a time or as an array
+    states = []
+    for moves in ["R U F' L2 D B", "L' U' F R2 D' B'", "U F R' D2 B L"]:
+        cube = Cube()
+        cube.doMoves(moves)
+        states.append(compactStates(cube.cubies.reshape(-1)))
+    keys = canonicalCompactStates(np.array([states, states[::-1]]))
+    assert keys.shape == (2, 3, NUM_CORNERS + NUM_EDGES)
+    assert (keys == keys[0, 0]).all()
+    assert keys[0, 0].tobytes() == cube.canonicalKey()
+
 
 ########################################
 # The cube
@@ -63,6 +159,9 @@ _faceToLetter = {
     F_D: 'D',
 }
 
+# The letter for each face, indexed by the F_* constants
+FACE_LETTERS = ''.join(_faceToLetter[face] for face in sorted(_faceToLetter))
+
 # Coordinate axes are (in order): front-ness, down-ness, right-ness. That is:
 #   - (0, 0, 0) is the BUL corner
 #   - (2, 0, 0) is the FUL corner
@@ -105,7 +204,7 @@ _notationMiddleSlice = {
 }
 
 def frontSlice(cubies):
-    return cubies[2]
+    return cubies[-1]
 
 # When parsing a cube algorithm like "R U R'", primarily split on whitespace.
 # However, sometimes for longer algorithms, people also add parentheses to show
@@ -120,19 +219,202 @@ def frontSlice(cubies):
 #     https://stackoverflow.com/a/10974950
 _algSplitRe = re.compile(r'(?:\s|\(|\))+')
 
+# How many moves apart a Cube's history saves the state, by default; see
+# Cube.enableHistory.
+DEFAULT_CHECKPOINT_INTERVAL = 64
+
 class Cube:
     def __init__(self):
-        self.cubies = np.full((3, 3, 3), CANONICAL_CUBIE)
+        # The state is kept in a _StateBuffer, which copies of the cube share
+        # until one of them changes it; see copy and the cubies property.
+        self._buffer = _StateBuffer(
+            np.full((3, 3, 3), CANONICAL_ORIENTATION, dtype=np.uint8))
 
-    # Note that the following does not work, because it considers the cube
-    # unsolved if any of the centers are rotated.
-    #def isCanonical(self):
-    #    'Check if cube is solved and in canonical orientation'
-    #    print(self.cubies)
-    #    print(self.cubies == CANONICAL_CUBIE)
-    #    return (self.cubies == CANONICAL_CUBIE).all()
+        # A CubeStats while performance counters are enabled, else None.
+        self.stats = None
 
-    def doMoves(self, moves):
+        # A MoveHistory while history is enabled, else None.
+        self.history = None
+
+    @property
+    def cubies(self):
+        '''
+        The state, as a (3, 3, 3) array. Each entry is an orientation index
+        (see "Orientation tables" below) rather than a packed cubie; the
+        packed form is only used to build the tables.
+
+        While the state is shared with a copy of the cube, the array is
+        read-only. Use the cube's methods to change it, or assign a new
+        state. Assigning one copies it (so the cube never changes an array
+        it was given), and clears the history, if it's enabled.
+        '''
+        return self._buffer.array
+
+    @cubies.setter
+    def cubies(self, cubies):
+        array = np.empty((3, 3, 3), dtype=np.uint8)
+        array[...] = np.asarray(cubies).reshape(3, 3, 3)
+        self._buffer.release()
+        self._buffer = _StateBuffer(array)
+        if self.history is not None:
+            self.enableHistory(
+                checkpointInterval=self.history.checkpointInterval)
+
+    def copy(self):
+        '''
+        Return a copy of the cube. This is cheap: the two share one state
+        until either of them is changed, and only then does that one get its
+        own. If this cube is collecting performance counters, the copy
+        starts its own. The history isn't copied.
+        '''
+        copy = Cube.__new__(Cube)
+        self._buffer.share()
+        copy._buffer = self._buffer
+        copy.stats = None if self.stats is None else CubeStats()
+        copy.history = None
+        return copy
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __del__(self):
+        # Let a copy still sharing the state have it to itself. (_buffer is
+        # missing if __init__ didn't get that far.)
+        buffer = getattr(self, '_buffer', None)
+        if buffer is not None:
+            buffer.release()
+
+    def enableStats(self, enabled=True):
+        '''
+        Start (or, if enabled is False, stop) collecting performance counters
+        for this cube in self.stats.
+        '''
+        self.stats = CubeStats() if enabled else None
+
+    def enableHistory(self, enabled=True,
+            checkpointInterval=DEFAULT_CHECKPOINT_INTERVAL):
+        '''
+        Start (or, if enabled is False, stop) recording the moves done to the
+        cube in self.history, so that they can be undone and redone (see
+        goToMove). The history starts out empty, at the current state.
+
+        Every checkpointInterval moves, the state is saved too, so going to
+        any point in the history takes at most that many moves.
+        '''
+        self.history = MoveHistory(self.cubies, checkpointInterval) \
+            if enabled else None
+
+    def undo(self, numMoves=1):
+        '''
+        Undo the last numMoves moves in the history.
+        '''
+        self.goToMove(self._requireHistory().position - numMoves)
+
+    def redo(self, numMoves=1):
+        '''
+        Redo the next numMoves moves in the history, after undoing them.
+        '''
+        self.goToMove(self._requireHistory().position + numMoves)
+
+    def goToMove(self, position):
+        '''
+        Undo or redo moves so that exactly the first position moves of the
+        history have been done. Doing a new move afterwards discards any
+        moves after that point.
+        '''
+        history = self._requireHistory()
+        if not 0 <= position <= len(history):
+            raise ValueError(f'No move {position} in a history of '
+                f'{len(history)} moves')
+        # Start from the nearest checkpoint before position, unless it's
+        # fewer moves from where we are now.
+        checkpoint = position // history.checkpointInterval
+        checkpointPosition = checkpoint * history.checkpointInterval
+        if position - checkpointPosition < abs(position - history.position):
+            self._setState(history.checkpoints[checkpoint])
+            history.position = checkpointPosition
+        while history.position < position:
+            self._applyTransform(
+                getMoveTransform(history.moveAt(history.position)))
+            history.position += 1
+        while history.position > position:
+            history.position -= 1
+            self._applyTransform(getMoveTransform(
+                invertMove(history.moveAt(history.position))))
+
+    def _requireHistory(self):
+        if self.history is None:
+            raise ValueError('History is not enabled for this cube; see '
+                'Cube.enableHistory')
+        return self.history
+
+    def _recordMove(self, move):
+        if self.history is not None:
+            self.history.record(move, self._buffer.array)
+
+    @classmethod
+    def fromFacelets(cls, facelets):
+        '''
+        Return a Cube in the state given by a facelet string: either the
+        54-character URFDLB string toFacelets writes (whitespace is ignored)
+        or, if it has more than one line, a net as __repr__ prints it.
+        Raise ValueError if the stickers don't make a reachable state.
+        '''
+        if not facelets.isascii():
+            raise ValueError(f'Invalid facelets {facelets!r}: '
+                f'{FACELET_ERRORS[FE_LETTERS]}')
+        if '\n' in facelets.strip():
+            facelets = netToFacelets(facelets)
+        states, errors = parseFaceletArray(
+            faceletArray([''.join(facelets.split())]))
+        if errors[0] != FE_OK:
+            raise ValueError(f'Invalid facelets {facelets!r}: '
+                f'{FACELET_ERRORS[errors[0]]}')
+        cube = cls()
+        cube.cubies = states[0].reshape(3, 3, 3)
+        return cube
+
+    def isSolved(self):
+        '''
+        Check if the cube is solved, in any orientation. Twisted centers
+        don't count against it, since you can't see them.
+        '''
+        return bool(isSolvedStates(self.cubies.reshape(-1)))
+
+    def currentFaces(self):
+        '''
+        Return a list giving, for each face (F_U through F_D), the face that
+        its center is on now. Before any whole-cube rotations (or slice
+        moves), that's the face itself.
+        '''
+        faces = [None] * len(_centerFaces)
+        centers = self.cubies.reshape(-1)[_centerPositions]
+        for face, orientation in zip(_centerFaces, centers):
+            faces[_colorToFace[_orientationFaces[orientation, face]]] = \
+                int(face)
+        return faces
+
+    def stateKey(self):
+        '''
+        Return a hashable key (20 bytes; see compactStates) for the position
+        of the cube. Cubes which differ only by a whole-cube rotation or by
+        twisted centers get the same key.
+        '''
+        return compactStates(self.cubies.reshape(-1)).tobytes()
+
+    def canonicalKey(self):
+        '''
+        Like stateKey, but the same for all positions that are equivalent up
+        to a symmetry of the cube (a rotation and/or mirror image), such as
+        the positions after R, F', and L'.
+        '''
+        return canonicalCompactStates(
+            compactStates(self.cubies.reshape(-1))).tobytes()
+
+    def doMoves(self, moves, optimize=False):
         # If moves is given as a string, split it using _algSplitRe before we
         # start parsing it. Note that this means you have to put spaces between
         # all the moves in your algorithms; you can't just write "RUR'U'" and
@@ -146,87 +428,51 @@ class Cube:
         # 3Rw turns the rightmost 3 layers, and 3R turns the third layer from
         # the right. So the string "R2U" could mean either "R2 U" or "R 2U".
         #
-        # TODO if it's a list, split each element on space/parens and flatten
-        # the result?
-        if type(moves) == str:
-            logging.info('doMoves: %s', moves)
-            moves = _algSplitRe.split(moves)
+        # If it's a list, each element is split the same way and the results
+        # are flattened. Either way, the moves are compiled (once, thanks to
+        # the cache in getAlgorithm) into a single Transform, so a whole
+        # algorithm costs about as much to apply as a single move.
+        #
+        # If optimize is true, the moves are first simplified with
+        # cube_algorithms.optimize (merging and cancelling adjacent moves),
+        # which leaves the cube in exactly the same state with fewer moves.
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        if optimize:
+            # Imported here since cube_algorithms imports this module.
+            from cube_algorithms import optimize as optimizeMoves
+            moves = optimizeMoves(moves)
+        if isinstance(moves, Algorithm):
+            algorithm = moves
         else:
-            logging.info('doMoves: %s', ' '.join(moves))
-        for move in moves:
+            algorithm = getAlgorithm(moves)
+        if stats is not None:
+            stats.parseTime += time.perf_counter() - start
+            stats.algorithms += 1
+        logging.info('doMoves: %s', algorithm)
+
+        if self.history is None and \
+                not logging.getLogger().isEnabledFor(logging.DEBUG):
+            if stats is not None:
+                stats.countMoveTypes(algorithm.moveTypes)
+            self._applyTransform(algorithm.transform)
+            return
+
+        # When debugging, go one move at a time so we can log each step. The
+        # history needs each move too, so it can put checkpoints between
+        # them.
+        for move in algorithm.moves:
             logging.debug("\n\n>>> EXECUTE MOVE: %s", move)
-            # Skip empty strings in case moves started/ended with a paren.
-            if move:
-                self.doOneMove(move)
+            self.doOneMove(move)
             logging.debug('After executing move: %s\n%s', move, self)
 
     def doOneMove(self, move):
-        face   = None
-        isWide = False
-
-        faceLetter = move[0]
-        rest       = move[1:]
-
-        # '[RLUDFB]' indicate a normal face turn
-        face = _notationFaceTurns.get(faceLetter, None)
-        if face is not None:
-            # '[RLUDFB]w' indicate a wide face turn (turn 2 layers at once)
-            if rest and rest[0] == 'w':
-                isWide = True
-                rest = rest[1:]
-        # '[rludfb]' also indicate a wide face turn
-        elif faceLetter.islower():
-            face = _notationFaceTurns.get(faceLetter.upper(), None)
-
-        numTurns = 1
-        # Note: intentionally allow "2'" since I've seen that used to indicate
-        # "rotate twice counterclockwise" (it's functionally equivalent to just
-        # "2", but provides a hint about which way you actually turn the face
-        # when executing). Probably we should allow "'2" similarly, though I
-        # haven't seen it yet.
-        if rest and rest[0] == '2':
-            numTurns = 2
-            rest = rest[1:]
-        if rest and rest[0] == "'":
-            numTurns = -numTurns
-            rest = rest[1:]
-        if rest:
-            raise ValueError(f'Unexpected characters at end of move: {move!r}')
-
-        # Handle normal face turns first because they're the common case
-        if face is not None:
-            if not isWide:
-                self.rotateFace(face, numTurns)
-            else:
-                # For a wide turn, rotate the whole cube and then rotate the
-                # opposite face back. Note that because the turns are clockwise
-                # relative to the face being turned, we do not need to negate
-                # numTurns when rotating the opposite face. For example, Rw is
-                # equivalent to x L, NOT x L'.
-                self.rotateWholeCube(face, numTurns)
-                self.rotateFace(_oppositeFace[face], numTurns)
-            return
-
-        # Not a normal face turn. Either a whole-cube rotation or a middle
-        # slice turn (or an error).
-        face = _notationWholeCube.get(faceLetter, None)
-        if face is not None:
-            self.rotateWholeCube(face, numTurns)
-            return
-
-        face = _notationMiddleSlice.get(faceLetter, None)
-        if face is not None:
-            # For a middle-slice turn, do a wide turn of the corresponding face
-            # in the same direction, then a normal turn in the opposite
-            # direction. For example, M is equivalent to Lw L'.
-            # Wide turn
-            self.rotateWholeCube(face, numTurns)
-            self.rotateFace(_oppositeFace[face], numTurns)
-            # Normal turn in opposite direction
-            self.rotateFace(face, -numTurns)
-            return
-
-        raise ValueError(f'Unrecognized face letter in move: {move!r}')
+        transform = getMoveTransform(move)
+        if self.stats is not None:
+            self.stats.countMoveTypes([parseMove(move)[0]])
+        self._applyTransform(transform)
+        self._recordMove(move)
 
     # TODO rename numQuarterTurns to numTurns, or maybe just turns, in a few
     # functions? Maybe also aboutFace -> face.
@@ -234,127 +480,85 @@ class Cube:
         '''
         Rotate just one face of the cube.
         '''
-
-        # Note this is not the most efficient implementation, but it's
-        # relatively easy to conceptualize.
-
-        self._debugCube("rotateFace start (%s)" % _faceToLetter[aboutFace])
-
-        # First, rotate the cube so the face in question is in front.
-        toFrontAbout, toFrontNum = self._getRotationFaceToFront(aboutFace)
-        self.rotateWholeCube(toFrontAbout, toFrontNum)
-
-        self._debugCube("=> rotateFace after rotate to front")
-
-        # Next, rotate the front face by the requested amount. Note that rot90
-        # defaults to the axes in counterclockwise order, so negate
-        # numQuarterTurns for a clockwise rotation.
-        # TODO factor out 2, as with frontSlice.
-        self.cubies[2] = np.rot90(self.cubies[2], k=-numQuarterTurns)
-        self.cubies[2] = self._rotateCubies(self.cubies[2], F_F,
-                numQuarterTurns)
-
-        self._debugCube("=> rotateFace after rotate front face")
-
-        # Finally, undo the original rotation.
-        self.rotateWholeCube(toFrontAbout, -toFrontNum)
-
-        self._debugCube("=> rotateFace after rotate back to orig face")
-
-    def _getRotationFaceToFront(self, face):
-        '''
-        Return (aboutFace, numQuarterTurns) that, when passed to
-        rotateWholeCube, would move 'face' to the front of the cube. For F_B,
-        do this in such a way that the orientation comes out correctly for
-        drawing the net for the cube (that is, rotate about the U/D axis, not
-        the L/R axis).
-        '''
-
-        return {
-            F_F : (F_U, 0), # No rotation needed
-            F_R : (F_U, 1),
-            F_B : (F_U, 2), # Use U/D axis so orientation is correct for net
-            F_L : (F_U, 3),
-            F_D : (F_R, 1),
-            F_U : (F_R, 3),
-        }[face]
+        if self.stats is not None:
+            self.stats.countMoveTypes([MT_FACE])
+        self._applyTransform(
+            _faceTurnTransforms[aboutFace][numQuarterTurns % 4])
+        if numQuarterTurns % 4 and self.history is not None:
+            self._recordMove(
+                _turnNames(MT_FACE)[(aboutFace, numQuarterTurns % 4)])
+        self._debugCube("rotateFace(%s, %d)",
+                _faceToLetter[aboutFace], numQuarterTurns)
 
     def rotateWholeCube(self, aboutFace, numQuarterTurns=1):
         '''
         Rotate the entire cube clockwise about aboutFace by
         numQuarterTurns * 90 degrees.
         '''
-        self._debugCube("rotateWholeCube(%s, %d), start" %
-                (_faceToLetter[aboutFace], numQuarterTurns))
-
-        self.cubies = self._getRotatedCubies(aboutFace, numQuarterTurns)
-        self._debugCube("=> rotateWholeCube after permute")
-
-        self.cubies = self._rotateCubies(self.cubies, aboutFace,
-                numQuarterTurns)
-        self._debugCube("=> rotateWholeCube after orient")
-
-    # FIXME: Name too similar to _getRotatedCubies.
-    def _rotateCubies(self, cubies, aboutFace, numQuarterTurns=1):
-        doRotate = lambda cubie: rotateCubie(cubie, aboutFace, numQuarterTurns)
-        vecRotate = np.vectorize(doRotate)
-        return vecRotate(cubies)
-
-    # TODO should this change the orientations of the cubies?
-    #   - If not, then rotateWholeCube is no longer a trivial wrapper around it
-    #     (current behavior)
-    #   - If so, then it becomes kind of expensive for __repr__ to use given
-    #     that __repr__ already knows which face to access
-    #       - On the other hand, maybe getCubieFaces becomes obsolete if we
-    #         always rotate the cube so we're accessing only front faces of
-    #         cubies.
-    #           - But if we're going to take advantage of this, probably the
-    #             front face of the cubie should be one of the two actually
-    #             stored in the cubie's number form (so we don't have to do a
-    #             cross-product to reconstruct it every time).
-    def _getRotatedCubies(self, aboutFace, numQuarterTurns=1):
-        '''
-        Return the new cubies array that would result from a cube rotation
-        (as with rotateWholeCube), but don't modify the cube.
-        '''
+        if self.stats is not None:
+            self.stats.countMoveTypes([MT_ROTATION])
+        self._applyTransform(
+            _wholeCubeTransforms[aboutFace][numQuarterTurns % 4])
+        if numQuarterTurns % 4 and self.history is not None:
+            self._recordMove(
+                _turnNames(MT_ROTATION)[(aboutFace, numQuarterTurns % 4)])
+        self._debugCube("rotateWholeCube(%s, %d)",
+                _faceToLetter[aboutFace], numQuarterTurns)
+
+    def _applyTransform(self, transform):
+        # Every change to the state goes through here, so this is where a
+        # cube that's sharing its state with copies gets its own. The state
+        # is always contiguous, so the reshape is a view and the update lands
+        # in self.cubies.
+        if self._buffer.owners > 1:
+            self._buffer = self._buffer.detach()
+        stats = self.stats
+        if stats is None:
+            transform.applyInPlace(self._buffer.array.reshape(-1))
+            return
+        start = time.perf_counter()
+        transform.applyInPlace(self._buffer.array.reshape(-1))
+        stats.applyTime += time.perf_counter() - start
+        stats.cubiesReoriented += len(transform.changed)
 
-        return np.rot90(self.cubies, axes=_axesForClockwiseRotation[aboutFace],
-                k=numQuarterTurns)
+    def _setState(self, flatCubies):
+        if self._buffer.owners > 1:
+            self._buffer = self._buffer.detach()
+        self._buffer.array.reshape(-1)[:] = flatCubies
 
     def __repr__(self):
         self._debugCube("Cube.__repr__")
-        front = self.faceToString(F_F, frontSlice(self.cubies))
-
-        # TODO use _getRotationFaceToFront here?
-
-        # clockwise about L maps U to F
-        up    = self.faceToString(F_U, frontSlice(np.rot90(self.cubies,
-                        axes=_axesForClockwiseRotation[F_L])))
-        # clockwise about R maps D to F
-        down  = self.faceToString(F_D, frontSlice(np.rot90(self.cubies,
-                        axes=_axesForClockwiseRotation[F_R])))
-
-        # clockwise about D maps L to F
-        left  = self.faceToString(F_L, frontSlice(np.rot90(self.cubies,
-                        axes=_axesForClockwiseRotation[F_D])))
-        # clockwise about U maps R to F
-        right = self.faceToString(F_R, frontSlice(np.rot90(self.cubies,
-                        axes=_axesForClockwiseRotation[F_U])))
-
-        # Twice clockwise about U maps B to F (in the orientation we want)
-        back  = self.faceToString(F_B, frontSlice(np.rot90(self.cubies,
-                        axes=_axesForClockwiseRotation[F_U], k=2)))
-
-        # TODO refactor with part of faceToString to avoid hardcoding this
-        emptyFace = '     \n     \n     '
+        if self.stats is not None:
+            start = time.perf_counter()
+        net = renderNets(self.cubies.reshape(-1)).tobytes().decode('ascii')
+        if self.stats is not None:
+            self.stats.renderTime += time.perf_counter() - start
+        return net
+
+    def toFacelets(self):
+        '''
+        Return the standard 54-character facelet string for the cube: the
+        stickers of U, R, F, D, L, B in that order, each face row by row as
+        drawn in the net, with each sticker given as the letter of the face
+        its color belongs to.
+        '''
+        return renderFacelets(self.cubies.reshape(-1)).tobytes().decode(
+            'ascii')
 
-        return concatFaces([emptyFace, up]) + '\n\n' + \
-            concatFaces([left, front, right, back]) + '\n\n' + \
-            concatFaces([emptyFace, down])
+    def homeFacelets(self):
+        '''
+        Return an array giving, for each of the 54 facelets (numbered in
+        URFDLB order; see faceletIndex), the facelet where the sticker
+        currently on it belongs.
+        '''
+        return homeFaceletStates(self.cubies.reshape(-1))
 
-    def _debugCube(self, msg):
-        logging.debug("%s:\n%s", msg,
-            np.vectorize(_debugCubieStr)(self.cubies))
+    def _debugCube(self, msg, *args):
+        # Building the snapshot isn't free, so skip it entirely unless someone
+        # is going to see it.
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(msg + ":\n%s", *args,
+                _orientationDebugStrs[self.cubies])
 
     def faceToString(self, face, faceGrid):
         """
@@ -369,12 +573,49 @@ class Cube:
             faceGrid[0,0] faceGrid[0,1] ...
             faceGrid[1,0]
             ...
+        Each entry of faceGrid is an orientation index.
         """
+        letters = _colorLetterBytes[_orientationFaces[faceGrid, face]]
         return '\n'.join(
-            ' '.join(
-                    _colorToLetter[getCubieFaces(cubie)[face]]
-                for cubie in row)
-            for row in faceGrid)
+            ' '.join(row.tobytes().decode('ascii'))
+            for row in letters)
+
+def faceGrid(cubies, face):
+    '''
+    Return the 3x3 block of cubies making up the given face, arranged the way
+    that face is drawn in the net printed by Cube.__repr__.
+    '''
+
+    axes, k = {
+        F_F : (None, 0),
+        # clockwise about L maps U to F
+        F_U : (_axesForClockwiseRotation[F_L], 1),
+        # clockwise about R maps D to F
+        F_D : (_axesForClockwiseRotation[F_R], 1),
+        # clockwise about D maps L to F
+        F_L : (_axesForClockwiseRotation[F_D], 1),
+        # clockwise about U maps R to F
+        F_R : (_axesForClockwiseRotation[F_U], 1),
+        # Twice clockwise about U maps B to F (in the orientation we want)
+        F_B : (_axesForClockwiseRotation[F_U], 2),
+    }[face]
+    if k:
+        cubies = np.rot90(cubies, axes=axes, k=k)
+    return frontSlice(cubies)
+
+def assembleNet(faceStrs):
+    '''
+    Lay out six face strings (as returned by Cube.faceToString, keyed by face)
+    as the net printed by Cube.__repr__.
+    '''
+
+    # TODO refactor with part of faceToString to avoid hardcoding this
+    emptyFace = '     \n     \n     '
+
+    return concatFaces([emptyFace, faceStrs[F_U]]) + '\n\n' + \
+        concatFaces([faceStrs[F_L], faceStrs[F_F], faceStrs[F_R],
+            faceStrs[F_B]]) + '\n\n' + \
+        concatFaces([emptyFace, faceStrs[F_D]])
 
 def concatFaces(faces):
     splitFaces = [face.split('\n') for face in faces]
@@ -491,6 +732,1560 @@ def unpackColor(color):
     return tuple((val + 1) % 3 - 1 for val in [x, y, z])
 
 
+########################################
+# Orientation tables
+#
+# Every cubie starts out as CANONICAL_CUBIE, so a cubie is completely described
+# by which of the 24 rotations has been applied to it. Rather than unpacking
+# colors and taking cross products every time we touch a cubie, enumerate the
+# 24 orientations once and precompute everything we need to know about them.
+# The cube stores orientation indices, so rotating any array of cubies is a
+# single fancy-index into _rotateOrientation.
+#
+# The slower tables to build here and below are cached on disk (see
+# table_cache), so that importing this module stays quick.
+
+# Bump this whenever a table cached by this module would come out different.
+TABLE_VERSION = 1
+
+# The definitions every table here is built from. They're part of each
+# table's cache key (see table_cache.loadTable), along with any further
+# inputs a table has, so editing them can't pick up stale tables.
+_tableInputs = [CANONICAL_CUBIE, _faceToLetter, _colorToLetter,
+    _axesForClockwiseRotation]
+
+def _loadTable(name, build, shape, dtype=np.intp, inputs=()):
+    # As a plain (read-only) ndarray rather than a memmap, whose indexing
+    # goes through Python code and is much slower.
+    return np.asarray(table_cache.loadTable('cube-' + name, TABLE_VERSION,
+        build, shape, dtype, [_tableInputs, inputs]))
+
+# 6 faces the canonical cubie's green side can point to, times 4 ways to turn
+# it about that
+NUM_ORIENTATIONS = 24
+CANONICAL_ORIENTATION = 0
+
+def _enumerateOrientations():
+    '''
+    Return a list of the 24 valid packed cubies, starting with
+    CANONICAL_CUBIE.
+    '''
+    cubies = [CANONICAL_CUBIE]
+    # Breadth-first search; note that cubies grows as we iterate over it.
+    for cubie in cubies:
+        for face in _faceToLetter:
+            rotated = rotateCubie(cubie, face)
+            if rotated not in cubies:
+                cubies.append(rotated)
+    return cubies
+
+_orientationCubies = _loadTable('orientation-cubies',
+    _enumerateOrientations, (NUM_ORIENTATIONS,))
+
+_cubieToOrientation = {int(cubie): orientation
+    for orientation, cubie in enumerate(_orientationCubies)}
+
+# fdr[orientation] -> colors of the F, D, and R sides (as getCubieFDR)
+_orientationFDR = _loadTable('orientation-fdr',
+    lambda: [getCubieFDR(cubie) for cubie in _orientationCubies],
+    (NUM_ORIENTATIONS, 3))
+
+# faces[orientation] -> colors in ULFRBD order (as getCubieFaces), so it can be
+# indexed by the F_* constants
+_orientationFaces = _loadTable('orientation-faces',
+    lambda: [getCubieFaces(cubie) for cubie in _orientationCubies],
+    (NUM_ORIENTATIONS, len(_faceToLetter)))
+
+# rotate[orientation, face, turns] -> orientation after rotating clockwise
+# about face by turns quarter turns (0 <= turns < 4)
+_rotateOrientation = _loadTable('rotate-orientation', lambda: np.array([
+        [
+            [
+                _cubieToOrientation[rotateCubie(cubie, face, turns)]
+                for turns in range(4)
+            ]
+            for face in sorted(_faceToLetter)
+        ]
+        for cubie in _orientationCubies
+    ]), (NUM_ORIENTATIONS, len(_faceToLetter), 4), np.uint8)
+
+_orientationDebugStrs = np.array([_debugCubieStr(cubie)
+    for cubie in _orientationCubies])
+
+
+########################################
+# Compiled moves
+#
+# Any move (or sequence of moves) rearranges the 27 cubie positions and rotates
+# the cubies as it moves them. So rather than simulating each move by rotating
+# the cube around, precompute for every move a Transform: a flat permutation
+# of the positions, plus the rotation to apply to the cubie arriving at each
+# position. Applying a move is then a take on the flattened cubies array and
+# a lookup in _orientationProduct.
+
+# Kinds of move, as returned by parseMove
+MT_FACE     = 0
+MT_WIDE     = 1
+MT_SLICE    = 2
+MT_ROTATION = 3
+
+def parseMove(move):
+    '''
+    Parse a single move, such as "R", "Rw2", "r'", "M2'", or "x". Return a
+    tuple (moveType, face, numTurns), where moveType is one of the MT_*
+    constants and face is the F_* constant the turn is clockwise about.
+    '''
+
+    face   = None
+    isWide = False
+
+    faceLetter = move[0]
+    rest       = move[1:]
+
+    # '[RLUDFB]' indicate a normal face turn
+    face = _notationFaceTurns.get(faceLetter, None)
+    if face is not None:
+        # '[RLUDFB]w' indicate a wide face turn (turn 2 layers at once)
+        if rest and rest[0] == 'w':
+            isWide = True
+            rest = rest[1:]
+    # '[rludfb]' also indicate a wide face turn
+    elif faceLetter.islower():
+        face = _notationFaceTurns.get(faceLetter.upper(), None)
+
+    numTurns = 1
+    # Note: intentionally allow "2'" since I've seen that used to indicate
+    # "rotate twice counterclockwise" (it's functionally equivalent to just
+    # "2", but provides a hint about which way you actually turn the face
+    # when executing). Probably we should allow "'2" similarly, though I
+    # haven't seen it yet.
+    if rest and rest[0] == '2':
+        numTurns = 2
+        rest = rest[1:]
+    if rest and rest[0] == "'":
+        numTurns = -numTurns
+        rest = rest[1:]
+    if rest:
+        raise ValueError(f'Unexpected characters at end of move: {move!r}')
+
+    if face is not None:
+        return (MT_WIDE if isWide else MT_FACE, face, numTurns)
+
+    # Not a normal face turn. Either a whole-cube rotation or a middle slice
+    # turn (or an error).
+    face = _notationWholeCube.get(faceLetter, None)
+    if face is not None:
+        return (MT_ROTATION, face, numTurns)
+
+    face = _notationMiddleSlice.get(faceLetter, None)
+    if face is not None:
+        return (MT_SLICE, face, numTurns)
+
+    raise ValueError(f'Unrecognized face letter in move: {move!r}')
+
+def invertMove(move):
+    '''
+    Return the move that undoes move, written the same way: "R" <-> "R'",
+    "Rw" <-> "Rw'", and so on. Half turns are their own inverse.
+    '''
+    # Make sure it's a move at all.
+    parseMove(move)
+    if move.endswith('2') or move.endswith("2'"):
+        return move
+    if move.endswith("'"):
+        return move[:-1]
+    return move + "'"
+
+def allMoveNames():
+    '''
+    Return every spelling of a move that parseMove accepts.
+    '''
+    letters = list(_notationFaceTurns) + \
+        [letter + 'w' for letter in _notationFaceTurns] + \
+        [letter.lower() for letter in _notationFaceTurns] + \
+        list(_notationWholeCube) + list(_notationMiddleSlice)
+    return [letter + suffix
+        for letter in letters
+        for suffix in ['', '2', "'", "2'"]]
+
+def rotateClockwise(cubies, face, numQuarterTurns=1):
+    '''
+    Return a (3, 3, 3) array (or a (size, size, size) one) turned as a whole
+    clockwise about face by numQuarterTurns quarter turns. Only the array is
+    rearranged; use Transform to turn the cubies themselves too.
+    '''
+    return np.rot90(cubies, axes=_axesForClockwiseRotation[face],
+        k=numQuarterTurns)
+
+def faceLayer(face, depth=0, size=3):
+    '''
+    Return an index expression selecting one layer of a (3, 3, 3) cubies
+    array (or of a (size, size, size) one): the layer depth layers in from
+    face (so depth 0 is the face itself and, on a 3x3x3, depth 1 is the
+    middle slice parallel to it).
+    '''
+    # Each face is either the high or the low end of one of the coordinate
+    # axes (front-ness, down-ness, right-ness).
+    axis, isHighEnd = {
+        F_F : (0, True),
+        F_B : (0, False),
+        F_D : (1, True),
+        F_U : (1, False),
+        F_R : (2, True),
+        F_L : (2, False),
+    }[face]
+    layer = [slice(None)] * 3
+    layer[axis] = size - 1 - depth if isHighEnd else depth
+    return tuple(layer)
+
+class Transform:
+    '''
+    A rearrangement of the cubies: the cubie that ends up at flat position i
+    comes from position perm[i], and is rotated by orientation twist[i] on the
+    way.
+    '''
+
+    def __init__(self, perm, twist):
+        self.perm  = perm
+        self.twist = twist
+        self._changed = None
+
+    @property
+    def changed(self):
+        '''
+        The positions this transform actually changes, so that applying it
+        in place only needs to touch those (e.g. 9 of the 27 for a face
+        turn). Computed on first use, since intermediate transforms built up
+        while composing are never applied.
+        '''
+        if self._changed is None:
+            self._changed = np.flatnonzero(
+                (self.perm != np.arange(len(self.perm))) |
+                (self.twist != CANONICAL_ORIENTATION))
+            self._changedPerm  = self.perm[self._changed]
+            self._changedTwist = self.twist[self._changed]
+        return self._changed
+
+    @classmethod
+    def identity(cls):
+        return cls(np.arange(27), np.full(27, CANONICAL_ORIENTATION,
+                dtype=np.uint8))
+
+    def then(self, other):
+        '''
+        Return the transform that does self, followed by other.
+        '''
+        return Transform(self.perm[other.perm],
+            _orientationProduct[other.twist, self.twist[other.perm]])
+
+    def inverse(self):
+        invPerm = np.argsort(self.perm)
+        return Transform(invPerm,
+            _orientationInverse[self.twist[invPerm]])
+
+    def power(self, n):
+        '''
+        Return the transform that does this one n times (n >= 0).
+        '''
+        result = Transform.identity()
+        square = self
+        while n:
+            if n & 1:
+                result = result.then(square)
+            square = square.then(square)
+            n >>= 1
+        return result
+
+    def order(self):
+        '''
+        Return the smallest n > 0 such that doing this transform n times
+        changes nothing, not even the twist of a center.
+        '''
+        # Follow each cycle of the permutation. After going once around a
+        # cycle, each of its cubies is back where it started, rotated by the
+        # product of the twists along the way; the cycle is done once that
+        # rotation has been repeated until it's the identity.
+        order = 1
+        seen = np.zeros(len(self.perm), dtype=bool)
+        for start in range(len(self.perm)):
+            if seen[start]:
+                continue
+            length = 0
+            rotation = CANONICAL_ORIENTATION
+            position = start
+            while not seen[position]:
+                seen[position] = True
+                rotation = _orientationProduct[rotation, self.twist[position]]
+                position = self.perm[position]
+                length += 1
+            repeats = 1
+            power = rotation
+            while power != CANONICAL_ORIENTATION:
+                power = _orientationProduct[rotation, power]
+                repeats += 1
+            order = math.lcm(order, length * repeats)
+        return order
+
+    def apply(self, flatCubies):
+        '''
+        Return the result of applying this transform to a flat array of 27
+        orientations (or to each row of an (N, 27) array of them).
+        '''
+        return _orientationProduct[self.twist,
+            np.take(flatCubies, self.perm, axis=-1)]
+
+    def applyInPlace(self, flatCubies):
+        '''
+        Like apply, but modify flatCubies (which may again be 1D or 2D)
+        instead of returning a new array, touching only the positions that
+        change.
+        '''
+        changed = self.changed
+        flatCubies[..., changed] = _orientationProduct[
+            self._changedTwist, flatCubies[..., self._changedPerm]]
+
+def _layerTurnTransform(aboutFace, depths, numQuarterTurns):
+    '''
+    Return the Transform that turns the layers at the given depths from
+    aboutFace (see _faceLayer) clockwise about that face, leaving the other
+    layers alone.
+    '''
+    positions = np.arange(27).reshape(3, 3, 3)
+    perm  = positions.copy()
+    twist = np.full((3, 3, 3), CANONICAL_ORIENTATION, dtype=np.uint8)
+
+    # Rotating the whole array maps each layer perpendicular to the axis onto
+    # itself, so we can take just the layers we want out of it.
+    rotated = rotateClockwise(positions, aboutFace, numQuarterTurns)
+    for depth in depths:
+        layer = faceLayer(aboutFace, depth)
+        perm[layer]  = rotated[layer]
+        twist[layer] = _rotateOrientation[CANONICAL_ORIENTATION, aboutFace,
+            numQuarterTurns % 4]
+    return Transform(perm.reshape(-1), twist.reshape(-1))
+
+# Which layers (as depths from the named face) each type of move turns
+_moveTypeDepths = {
+    MT_FACE     : (0,),
+    MT_WIDE     : (0, 1),
+    # Note the slice moves are named after the face they turn with (M turns
+    # the same way as L); see _notationMiddleSlice.
+    MT_SLICE    : (1,),
+    MT_ROTATION : (0, 1, 2),
+}
+
+def compileMove(move):
+    '''
+    Parse a single move and return the corresponding Transform.
+    '''
+    moveType, face, numTurns = parseMove(move)
+    return _layerTurnTransform(face, _moveTypeDepths[moveType], numTurns)
+
+def getMoveTransform(move):
+    '''
+    Return the (cached) Transform for a single move.
+    '''
+    transform = _moveTransforms.get(move)
+    if transform is None:
+        transform = compileMove(move)
+        _moveTransforms[move] = transform
+    return transform
+
+def _orientationMatrix(orientation):
+    # The rotation (in front-ness, down-ness, right-ness coordinates) that
+    # was applied to the cubie. Its rows are the unpacked colors showing on
+    # the F, D, and R sides, since each color is the direction its sticker
+    # faced in the canonical state.
+    return np.array([unpackColor(color)
+        for color in _orientationFDR[orientation]])
+
+def _buildOrientationProduct():
+    matrices = [_orientationMatrix(o) for o in range(NUM_ORIENTATIONS)]
+    matrixToOrientation = {m.tobytes(): o for o, m in enumerate(matrices)}
+    return np.array([
+            [matrixToOrientation[(a @ b).tobytes()] for b in matrices]
+            for a in matrices
+        ], dtype=np.uint8)
+
+# product[a, b] -> orientation of a cubie rotated by b and then by a
+_orientationProduct = _buildOrientationProduct()
+_orientationInverse = np.argmax(
+    _orientationProduct == CANONICAL_ORIENTATION, axis=1).astype(np.uint8)
+
+_wholeCubeTransforms = {face: [_layerTurnTransform(face, (0, 1, 2), n)
+        for n in range(4)]
+    for face in _faceToLetter}
+_faceTurnTransforms = {face: [_layerTurnTransform(face, (0,), n)
+        for n in range(4)]
+    for face in _faceToLetter}
+
+# Filled in by getMoveTransform as moves are first used
+_moveTransforms = {}
+
+
+########################################
+# Algorithms
+
+# Maximum number of distinct algorithms to keep compiled at once.
+ALG_CACHE_SIZE = 4096
+
+def splitAlg(moves):
+    '''
+    Split an algorithm (a string, or a list of strings) into a list of
+    individual moves, dropping any grouping parentheses. Commutators and
+    conjugates in bracket notation ("[R, U]", "[R: U]") are expanded.
+    '''
+    if isinstance(moves, str):
+        moves = [moves]
+    if any('[' in part for part in moves):
+        # Imported here since cube_algorithms imports this module.
+        from cube_algorithms import expandBrackets
+        moves = [' '.join(expandBrackets(part)) for part in moves]
+    # Skip empty strings in case moves started/ended with a paren.
+    return [move
+        for part in moves
+        for move in _algSplitRe.split(part)
+        if move]
+
+class Algorithm:
+    '''
+    A sequence of moves, parsed once and composed into a single Transform.
+    '''
+
+    def __init__(self, moves):
+        self.moves = splitAlg(moves)
+        self.transform = Transform.identity()
+        for move in self.moves:
+            self.transform = self.transform.then(getMoveTransform(move))
+        # The MT_* type of each move, for CubeStats
+        self.moveTypes = [parseMove(move)[0] for move in self.moves]
+
+    @classmethod
+    def precompiled(cls, moves, transform):
+        '''
+        Return the Algorithm for moves, given the Transform they compose to
+        (e.g. loaded from a table), rather than composing them again.
+        '''
+        algorithm = cls.__new__(cls)
+        algorithm.moves     = splitAlg(moves)
+        algorithm.moveTypes = [parseMove(move)[0] for move in algorithm.moves]
+        algorithm.transform = transform
+        return algorithm
+
+    @classmethod
+    def concatenate(cls, algorithms):
+        '''
+        Return the Algorithm that does each of algorithms in turn, reusing
+        their compiled transforms rather than recompiling the moves.
+        '''
+        combined = cls.__new__(cls)
+        combined.moves     = []
+        combined.moveTypes = []
+        perm  = np.arange(27)
+        twist = np.full(27, CANONICAL_ORIENTATION, dtype=np.uint8)
+        for algorithm in algorithms:
+            combined.moves.extend(algorithm.moves)
+            combined.moveTypes.extend(algorithm.moveTypes)
+            # As in Transform.then, but without building every intermediate
+            # Transform.
+            nextPerm = algorithm.transform.perm
+            perm, twist = perm[nextPerm], \
+                _orientationProduct[algorithm.transform.twist, twist[nextPerm]]
+        combined.transform = Transform(perm, twist)
+        return combined
+
+    def then(self, other):
+        '''
+        Return the Algorithm that does self, followed by other.
+        '''
+        return Algorithm.concatenate([self, other])
+
+    def inverse(self):
+        '''
+        Return the Algorithm that undoes this one: the inverse of each move,
+        in reverse order.
+        '''
+        inverse = Algorithm.__new__(Algorithm)
+        inverse.moves     = [invertMove(move) for move in reversed(self.moves)]
+        inverse.moveTypes = self.moveTypes[::-1]
+        inverse.transform = self.transform.inverse()
+        return inverse
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __str__(self):
+        return ' '.join(self.moves)
+
+    def __repr__(self):
+        return f'Algorithm({str(self)!r})'
+
+def getAlgorithm(moves):
+    '''
+    Return the compiled Algorithm for moves (a string or list of strings).
+    Algorithms are cached by their normalized text, so e.g. "(R U R' U')" and
+    "R U  R' U'" share one entry.
+    '''
+    return _getAlgorithmCached(' '.join(splitAlg(moves)))
+
+@functools.lru_cache(maxsize=ALG_CACHE_SIZE)
+def _getAlgorithmCached(normalizedMoves):
+    return Algorithm(normalizedMoves)
+
+def clearAlgorithmCache():
+    '''
+    Forget every Algorithm compiled by getAlgorithm, so the next ones are
+    compiled from scratch (e.g. to time that).
+    '''
+    _getAlgorithmCached.cache_clear()
+
+
+########################################
+# Instrumentation
+
+_moveTypeNames = {
+    MT_FACE     : 'face',
+    MT_WIDE     : 'wide',
+    MT_SLICE    : 'slice',
+    MT_ROTATION : 'rotation',
+}
+
+class CubeStats:
+    '''
+    Performance counters for a single Cube; see Cube.enableStats. Times are in
+    seconds.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.movesByType      = {name: 0 for name in _moveTypeNames.values()}
+        self.algorithms       = 0
+        self.cubiesReoriented = 0
+        self.parseTime        = 0.0
+        self.applyTime        = 0.0
+        self.renderTime       = 0.0
+
+    def countMoveTypes(self, moveTypes):
+        for moveType in moveTypes:
+            self.movesByType[_moveTypeNames[moveType]] += 1
+
+    def asDict(self):
+        return {
+            'movesByType'      : dict(self.movesByType),
+            'algorithms'       : self.algorithms,
+            'cubiesReoriented' : self.cubiesReoriented,
+            'parseTime'        : self.parseTime,
+            'applyTime'        : self.applyTime,
+            'renderTime'       : self.renderTime,
+        }
+
+    def __str__(self):
+        moves = ', '.join(f'{name} {count}'
+            for name, count in self.movesByType.items())
+        return '\n'.join([
+            f'Moves:             {moves}',
+            f'Algorithms:        {self.algorithms}',
+            f'Cubies reoriented: {self.cubiesReoriented}',
+            f'Parse time:        {self.parseTime * 1000:.3f} ms',
+            f'Apply time:        {self.applyTime * 1000:.3f} ms',
+            f'Render time:       {self.renderTime * 1000:.3f} ms',
+        ])
+
+
+########################################
+# State buffers
+#
+# Copies of a Cube share one state array until one of them changes it (copy
+# on write), which makes branching off copies nearly free when most of them
+# are only looked at.
+#
+# Arrays aren't pooled for reuse: Cube.cubies hands out the array itself, so
+# one can't be recycled while anything else might still hold it, and numpy
+# already keeps a cache of small data blocks that makes a fresh 27-byte
+# array about as cheap as refilling an old one.
+
+class _StateBuffer:
+    '''
+    A (3, 3, 3) state array and the number of cubes sharing it. While there
+    is more than one, the array is read-only, so that nothing can change it
+    under the others.
+    '''
+
+    __slots__ = ('array', 'owners')
+
+    def __init__(self, array):
+        self.array  = array
+        self.owners = 1
+
+    def share(self):
+        self.owners += 1
+        self.array.flags.writeable = False
+
+    def detach(self):
+        '''
+        Stop sharing this buffer, and return a new one with a copy of its
+        state.
+        '''
+        self.release()
+        return _StateBuffer(self.array.copy())
+
+    def release(self):
+        self.owners -= 1
+        if self.owners == 1:
+            self.array.flags.writeable = True
+
+
+########################################
+# History
+#
+# Moves are recorded by their index in allMoveNames(), one byte each.
+
+_moveNames = allMoveNames()
+
+class MoveHistory:
+    '''
+    The moves done to a single Cube; see Cube.enableHistory. The first
+    position of them are currently done; the rest have been undone and can
+    be redone. checkpoints[i] is the (flat) state after the first
+    i * checkpointInterval moves.
+    '''
+
+    def __init__(self, cubies, checkpointInterval=DEFAULT_CHECKPOINT_INTERVAL):
+        if checkpointInterval < 1:
+            raise ValueError('checkpointInterval must be at least 1')
+        self.checkpointInterval = checkpointInterval
+        self.position = 0
+        self.checkpoints = [cubies.reshape(-1).copy()]
+        self._moves = bytearray()
+
+    def __len__(self):
+        return len(self._moves)
+
+    def moveAt(self, i):
+        return _moveNames[self._moves[i]]
+
+    @property
+    def moves(self):
+        '''
+        All the moves in the history, including any that have been undone.
+        '''
+        return [_moveNames[index] for index in self._moves]
+
+    def record(self, move, cubies):
+        '''
+        Add move, which has just been done, leaving the cube in state cubies.
+        Any moves that were undone are forgotten.
+        '''
+        del self._moves[self.position:]
+        del self.checkpoints[self.position // self.checkpointInterval + 1:]
+        self._moves.append(_moveTables()[0][move])
+        self.position += 1
+        if self.position % self.checkpointInterval == 0:
+            self.checkpoints.append(cubies.reshape(-1).copy())
+
+    def __str__(self):
+        done = ' '.join(self.moves[:self.position])
+        undone = ' '.join(self.moves[self.position:])
+        return f'{done} | {undone}' if undone else done
+
+@functools.lru_cache(maxsize=None)
+def _turnNames(moveType):
+    # {(face, numQuarterTurns): the name of a move that does the same as
+    # rotateFace (for MT_FACE) or rotateWholeCube (for MT_ROTATION)}, for
+    # recording those in the history. Built on first use.
+    transforms = {MT_FACE: _faceTurnTransforms,
+        MT_ROTATION: _wholeCubeTransforms}[moveType]
+    names = {}
+    for face, faceTransforms in transforms.items():
+        for numQuarterTurns in range(1, 4):
+            transform = faceTransforms[numQuarterTurns]
+            names[(face, numQuarterTurns)] = next(name
+                for name in _moveNames
+                if np.array_equal(getMoveTransform(name).perm,
+                        transform.perm)
+                    and np.array_equal(getMoveTransform(name).twist,
+                        transform.twist))
+    return names
+
+
+########################################
+# Facelets
+#
+# The 54 stickers, numbered in the standard URFDLB order: all of U, then R, F,
+# D, L, B, each face row by row as it's drawn in the net. For each one we know
+# which flat cubie position it's on and which side of that cubie shows.
+
+FACELET_FACES = [F_U, F_R, F_F, F_D, F_L, F_B]
+_allFacelets = np.arange(54)
+
+def _buildFaceletTables():
+    positions = np.arange(27).reshape(3, 3, 3)
+    faceletPositions = np.concatenate([faceGrid(positions, face).reshape(-1)
+        for face in FACELET_FACES])
+    faceletFaces = np.repeat(FACELET_FACES, 9)
+    return faceletPositions, faceletFaces
+
+_faceletPositions, _faceletFaces = _buildFaceletTables()
+
+def faceletIndex(face, row, col):
+    '''
+    Return the number of the facelet at the given row and column of a face,
+    as that face is drawn in the net.
+    '''
+    return 9 * FACELET_FACES.index(face) + 3 * row + col
+
+# The face whose center is the given color on a solved cube
+_colorToFace = {int(color): face
+    for face, color in enumerate(_orientationFaces[CANONICAL_ORIENTATION])}
+
+def _buildHomeFacelets():
+    # homeFacelet[facelet, orientation] -> the facelet where the sticker
+    # showing on facelet belongs, if the cubie there has that orientation.
+    faceletAt = {(int(position), int(face)): facelet
+        for facelet, (position, face)
+        in enumerate(zip(_faceletPositions, _faceletFaces))}
+    homeFacelet = np.zeros((54, NUM_ORIENTATIONS), dtype=np.uint8)
+    for facelet, (position, face) in enumerate(
+            zip(_faceletPositions, _faceletFaces)):
+        coords = np.array(np.unravel_index(position, (3, 3, 3))) - 1
+        for orientation in range(NUM_ORIENTATIONS):
+            # The orientation matrix is a rotation, so its transpose undoes
+            # it and takes us back to where the cubie started.
+            home = _orientationMatrix(orientation).T @ coords + 1
+            homePosition = np.ravel_multi_index(tuple(home), (3, 3, 3))
+            # Each color is the direction its sticker faced when solved.
+            homeFace = _colorToFace[_orientationFaces[orientation, face]]
+            homeFacelet[facelet, orientation] = \
+                faceletAt[(int(homePosition), homeFace)]
+    return homeFacelet
+
+_homeFacelet = _loadTable('home-facelet', _buildHomeFacelets,
+    (54, NUM_ORIENTATIONS), np.uint8, FACELET_FACES)
+
+def homeFaceletStates(states, facelets=_allFacelets):
+    '''
+    Like Cube.homeFacelets, for an array of flat cube states and just the
+    given facelets: shape (..., 27) in, (..., len(facelets)) out.
+    '''
+    # Flat lookups are quite a bit faster than 2D fancy indexing.
+    facelets = np.asarray(facelets)
+    return _homeFacelet.reshape(-1)[facelets * NUM_ORIENTATIONS +
+        np.take(states, _faceletPositions[facelets], axis=-1)]
+
+
+
+########################################
+# Solved check
+#
+# On a solved cube, every cubie has been rotated by the same whole-cube
+# rotation (the frame), which we can read off two of the centers. So checking
+# whether a cube is solved is one comparison of the corners and edges against
+# the frame, plus a check that the centers show the frame's colors (their
+# orientations can differ from the frame by an invisible twist).
+
+def _buildSolvedCheckTables():
+    positions = np.arange(27).reshape(3, 3, 3)
+    centerFaces = np.array(sorted(_faceToLetter))
+    centerPositions = np.array([positions[faceLayer(face)][1, 1]
+        for face in centerFaces])
+    core = positions[1, 1, 1]
+    piecePositions = np.array([position for position in range(27)
+        if position not in centerPositions and position != core])
+
+    # frame[upColor, frontColor] -> the orientation showing those colors on
+    # its U and F sides
+    frame = np.zeros((max(_colorToLetter) + 1,) * 2, dtype=np.uint8)
+    for orientation in range(NUM_ORIENTATIONS):
+        faces = _orientationFaces[orientation]
+        frame[faces[F_U], faces[F_F]] = orientation
+
+    return centerFaces, centerPositions, piecePositions, frame
+
+_centerFaces, _centerPositions, _piecePositions, _frameFromCenters = \
+    _buildSolvedCheckTables()
+
+def getFrames(states):
+    '''
+    Return the whole-cube orientation (the frame) implied by the U and F
+    centers, for an array of flat cube states: shape (..., 27) in, (...) out.
+    '''
+    states = np.asarray(states)
+    centers = states[..., _centerPositions]
+    return _frameFromCenters[_orientationFaces[centers[..., F_U], F_U],
+        _orientationFaces[centers[..., F_F], F_F]]
+
+def frameRelativeStates(states):
+    '''
+    Factor whole-cube rotations out of an array of flat cube states: shape
+    (..., 27) in, (..., 27) out. Each cubie stays where it is, but its
+    orientation is taken relative to the frame (see getFrames), so the
+    result is what the same face turns, as named by where the centers are
+    now, would do to a solved cube with its centers at home. (compactStates
+    instead turns the whole cube back until its centers are at home.)
+    '''
+    states = np.asarray(states)
+    inverses = _orientationInverse[getFrames(states)][..., np.newaxis]
+    return _orientationProduct[states, inverses]
+
+def isSolvedStates(states):
+    '''
+    Check which of an array of flat cube states are solved (in any
+    orientation): shape (..., 27) in, boolean (...) out.
+    '''
+    states = np.asarray(states)
+    frames = getFrames(states)
+    piecesSolved = (states[..., _piecePositions] ==
+        frames[..., np.newaxis]).all(axis=-1)
+    centerColors = _orientationFaces[states[..., _centerPositions],
+        _centerFaces]
+    centersSolved = (centerColors ==
+        _orientationFaces[frames][..., _centerFaces]).all(axis=-1)
+    return piecesSolved & centersSolved
+
+
+
+########################################
+# Rendering
+#
+# Rendering goes straight from orientations to text: a single lookup gives the
+# letter for every facelet, and those are dropped into the precomputed slots
+# of a template net. There are no intermediate rotated copies of the cube and
+# no per-sticker Python code.
+
+def _buildNetTemplate():
+    # Render a net with a distinct placeholder character for each facelet,
+    # then note where each one ended up.
+    placeholders = [chr(0x100 + i) for i in range(54)]
+    faceStrs = {}
+    for i, face in enumerate(FACELET_FACES):
+        rows = [placeholders[9*i + 3*r : 9*i + 3*r + 3] for r in range(3)]
+        faceStrs[face] = '\n'.join(' '.join(row) for row in rows)
+    net = assembleNet(faceStrs)
+    slots = np.array([net.index(p) for p in placeholders])
+    for p in placeholders:
+        net = net.replace(p, ' ')
+    return np.frombuffer(net.encode('ascii'), dtype=np.uint8), slots
+
+_netTemplate, _netSlots = _buildNetTemplate()
+
+# Indexed by color: the letter for that color in the net, and the letter of
+# the face with that color in a URFDLB facelet string.
+_colorLetterBytes = np.zeros(max(_colorToLetter) + 1, dtype=np.uint8)
+_colorFaceLetterBytes = np.zeros(max(_colorToLetter) + 1, dtype=np.uint8)
+for _color, _letter in _colorToLetter.items():
+    _colorLetterBytes[_color] = ord(_letter)
+    _colorFaceLetterBytes[_color] = ord(_faceToLetter[_colorToFace[_color]])
+
+# For a facelet showing the side of a cubie with a given orientation, these
+# give the letter to draw, flattened so that facelet i, orientation o is at
+# _faceletLetterOffsets[i] + o.
+_faceletLetterOffsets = np.arange(54) * NUM_ORIENTATIONS
+_faceletColors3D = _orientationFaces[:, _faceletFaces].T
+_faceletColorLetters = _colorLetterBytes[_faceletColors3D].reshape(-1)
+_faceletFaceLetters = _colorFaceLetterBytes[_faceletColors3D].reshape(-1)
+del _faceletColors3D
+
+def _faceletLetters(states, letterTable):
+    '''
+    Look up a letter (as a byte) for every facelet of an array of flat cube
+    states: shape (..., 27) in, (..., 54) out.
+    '''
+    return letterTable[np.take(states, _faceletPositions, axis=-1) +
+        _faceletLetterOffsets]
+
+def renderNets(states):
+    '''
+    Return the nets (as printed by Cube.__repr__) for an array of flat cube
+    states, as an array of bytes: shape (..., 27) in, (..., len(net)) out.
+    '''
+    states = np.asarray(states)
+    nets = np.empty(states.shape[:-1] + _netTemplate.shape, dtype=np.uint8)
+    nets[...] = _netTemplate
+    nets[..., _netSlots] = _faceletLetters(states, _faceletColorLetters)
+    return nets
+
+def renderFacelets(states):
+    '''
+    Return the 54-character URFDLB facelet strings for an array of flat cube
+    states, as an array of bytes: shape (..., 27) in, (..., 54) out. Each
+    character is the face that sticker's color belongs to on a solved cube,
+    so a solved cube is "UUUUUUUUURRRRRRRRRFFFFFFFFFDDDDDDDDDLLLLLLLLLBBBBBBBBB".
+    '''
+    return _faceletLetters(states, _faceletFaceLetters)
+
+
+########################################
+# Batches of cubes
+
+# Move index used to pad rows of a move matrix (see encodeMoveMatrix). It
+# refers to the identity transform.
+MOVE_PADDING = len(allMoveNames())
+
+@functools.lru_cache(maxsize=None)
+def _moveTables():
+    # (moveIndex, perms, twists): the index of each move name, and the perm
+    # and twist of each move's transform by index (plus MOVE_PADDING). Built
+    # on first use.
+    names = allMoveNames()
+    transforms = [getMoveTransform(name) for name in names] + \
+        [Transform.identity()]
+    moveIndex = {name: i for i, name in enumerate(names)}
+    perms  = np.array([t.perm  for t in transforms], dtype=np.intp)
+    twists = np.array([t.twist for t in transforms], dtype=np.uint8)
+    return moveIndex, perms, twists
+
+def transformStates(states, perms, twists):
+    '''
+    Apply a different transform to each of an (N, 27) array of flat cube
+    states: row i of perms and of twists (both (N, 27) arrays) are the perm
+    and twist of the Transform to apply to states[i].
+    '''
+    # Gathering and looking up through flat indices is quite a bit faster
+    # than take_along_axis and 2D fancy indexing.
+    states = np.ascontiguousarray(states)
+    rowStarts = np.arange(0, states.size, 27)[:, np.newaxis]
+    gathered = states.reshape(-1)[perms + rowStarts]
+    return _orientationProduct.reshape(-1)[
+        twists.astype(np.intp) * NUM_ORIENTATIONS + gathered]
+
+def encodeMoveMatrix(algs):
+    '''
+    Turn a list of N algorithms (each anything Cube.doMoves accepts) into an
+    (N, L) array of move indices, where L is the length of the longest one.
+    Shorter rows are padded at the end with MOVE_PADDING.
+    '''
+    algs = [splitAlg(alg) for alg in algs]
+    moveIndex = _moveTables()[0]
+    length = max((len(alg) for alg in algs), default=0)
+    moveMatrix = np.full((len(algs), length), MOVE_PADDING, dtype=np.int16)
+    for i, alg in enumerate(algs):
+        for j, move in enumerate(alg):
+            index = moveIndex.get(move)
+            if index is None:
+                # Not a move we know; parse it for a useful error message.
+                parseMove(move)
+                raise ValueError(f'Unsupported move: {move!r}')
+            moveMatrix[i, j] = index
+    return moveMatrix
+
+class CubeBatch:
+    '''
+    N cubes, stored as one contiguous (N, 27) array of orientation indices.
+    Row i is laid out like Cube.cubies flattened.
+    '''
+
+    def __init__(self, numCubes):
+        self.states = np.full((numCubes, 27), CANONICAL_ORIENTATION,
+            dtype=np.uint8)
+
+    @classmethod
+    def fromCubes(cls, cubes):
+        batch = cls(0)
+        batch.states = np.array([cube.cubies.reshape(-1) for cube in cubes],
+            dtype=np.uint8).reshape(-1, 27)
+        return batch
+
+    @classmethod
+    def fromFacelets(cls, facelets):
+        '''
+        Return a batch of the states given by a list (or array; see
+        faceletArray) of URFDLB facelet strings. Raise ValueError if any of
+        them is invalid; use parseFaceletArray to sort out which.
+        '''
+        states, errors = parseFaceletArray(faceletArray(facelets))
+        bad = np.flatnonzero(errors != FE_OK)
+        if len(bad):
+            raise ValueError(f'{len(bad)} invalid facelet strings; the first, '
+                f'at index {bad[0]}, is invalid because '
+                f'{FACELET_ERRORS[errors[bad[0]]]}')
+        batch = cls(0)
+        batch.states = states
+        return batch
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, i):
+        '''
+        Return a (separate) Cube with the state of the i'th cube.
+        '''
+        cube = Cube()
+        cube.cubies = self.states[i].reshape(3, 3, 3).copy()
+        return cube
+
+    def doMoves(self, moves):
+        '''
+        Apply the same moves to every cube in the batch.
+        '''
+        if not isinstance(moves, Algorithm):
+            moves = getAlgorithm(moves)
+        moves.transform.applyInPlace(self.states)
+
+    def doMovesPerCube(self, algs):
+        '''
+        Apply algs[i] to cube i, for each i. The algorithms may have different
+        lengths.
+        '''
+        self.doMoveMatrix(encodeMoveMatrix(algs))
+
+    def doMoveMatrix(self, moveMatrix):
+        '''
+        Apply moveMatrix[i, j] (a move index from encodeMoveMatrix) to cube i,
+        for j = 0, 1, ... in order. Each step is vectorized over all the
+        cubes.
+        '''
+        moveMatrix = np.asarray(moveMatrix)
+        assert moveMatrix.shape[0] == len(self.states)
+        _, perms, twists = _moveTables()
+        for column in moveMatrix.T:
+            self.states = transformStates(self.states, perms[column],
+                twists[column])
+
+    def isSolved(self):
+        '''
+        Return a boolean array saying which cubes are solved. Whole-cube
+        rotations and twisted centers don't count against being solved.
+        '''
+        return isSolvedStates(self.states)
+
+    def toStrings(self):
+        '''
+        Return a list with the net (as printed by Cube.__repr__) for each
+        cube.
+        '''
+        return [net.tobytes().decode('ascii')
+            for net in renderNets(self.states)]
+
+    def toFacelets(self):
+        '''
+        Return a list with the URFDLB facelet string (as Cube.toFacelets) for
+        each cube.
+        '''
+        return [facelets.tobytes().decode('ascii')
+            for facelets in renderFacelets(self.states)]
+
+
+########################################
+# Compact cubes
+#
+# The 20 movable pieces, in the usual (Kociemba) order. Each is given by the
+# faces its stickers point towards; for corners these go clockwise starting
+# from the U or D sticker, and for edges the U/D sticker (or else the F/B
+# one) comes first. The first sticker is the piece's reference sticker: a
+# corner's twist (0-2) is how far clockwise around the slot its reference
+# sticker has moved from the slot's first facelet, and an edge's flip (0-1)
+# is likewise.
+
+CORNER_NAMES = ['URF', 'UFL', 'ULB', 'UBR', 'DFR', 'DLF', 'DBL', 'DRB']
+EDGE_NAMES   = ['UR', 'UF', 'UL', 'UB', 'DR', 'DF', 'DL', 'DB',
+                'FR', 'FL', 'BL', 'BR']
+NUM_CORNERS = len(CORNER_NAMES)
+NUM_EDGES   = len(EDGE_NAMES)
+
+_letterToFace = {letter: face for face, letter in _faceToLetter.items()}
+
+def _piecePosition(faces):
+    # (front-ness, down-ness, right-ness) of the slot next to all the faces
+    coords = [1, 1, 1]
+    for face in faces:
+        axis, side = {
+            F_B: (0, 0), F_F: (0, 2),
+            F_U: (1, 0), F_D: (1, 2),
+            F_L: (2, 0), F_R: (2, 2),
+        }[face]
+        coords[axis] = side
+    return np.ravel_multi_index(tuple(coords), (3, 3, 3))
+
+@functools.lru_cache(maxsize=None)
+def _buildCompactTables():
+    pieceFaces = [[_letterToFace[letter] for letter in name]
+        for name in CORNER_NAMES + EDGE_NAMES]
+    slotPositions = np.array([_piecePosition(faces) for faces in pieceFaces])
+    # Piece number (within corners or edges) and reference face, by the set
+    # of faces the piece's stickers belong to
+    pieceIndex = {}
+    for names in [CORNER_NAMES, EDGE_NAMES]:
+        for piece, name in enumerate(names):
+            faces = [_letterToFace[letter] for letter in name]
+            pieceIndex[frozenset(faces)] = (piece, faces[0])
+
+    # Which piece (and how it's turned) is in each slot, for each reduced
+    # orientation (that is, relative to a cube with its centers at home).
+    # Each entry is piece * 3 + twist for corners, piece * 2 + flip for
+    # edges; since either way that's a bijection on range(24), it can be
+    # inverted to go back to an orientation.
+    valueFromOrientation = np.zeros((len(pieceFaces), NUM_ORIENTATIONS),
+        dtype=np.uint8)
+    for slot, faces in enumerate(pieceFaces):
+        for orientation in range(NUM_ORIENTATIONS):
+            homeFaces = [_colorToFace[_orientationFaces[orientation, face]]
+                for face in faces]
+            piece, referenceFace = pieceIndex[frozenset(homeFaces)]
+            turn = homeFaces.index(referenceFace)
+            valueFromOrientation[slot, orientation] = \
+                piece * len(faces) + turn
+    orientationFromValue = np.argsort(valueFromOrientation, axis=1).astype(
+        np.uint8)
+
+    # For a cube whose frame (see getFrames) is each orientation: the flat
+    # position of each slot, and the value of each slot given its physical
+    # orientation.
+    framePositions = np.zeros((NUM_ORIENTATIONS, len(pieceFaces)),
+        dtype=np.intp)
+    frameValues = np.zeros(
+        (NUM_ORIENTATIONS, len(pieceFaces), NUM_ORIENTATIONS), dtype=np.uint8)
+    for frame in range(NUM_ORIENTATIONS):
+        matrix = _orientationMatrix(frame)
+        for slot, position in enumerate(slotPositions):
+            coords = np.array(np.unravel_index(position, (3, 3, 3))) - 1
+            framePositions[frame, slot] = np.ravel_multi_index(
+                tuple(matrix @ coords + 1), (3, 3, 3))
+        reduced = _orientationProduct[_orientationInverse[frame]]
+        frameValues[frame] = valueFromOrientation[:, reduced]
+
+    return slotPositions, orientationFromValue, framePositions, frameValues
+
+_numSlots = NUM_CORNERS + NUM_EDGES
+_slotPositions, _orientationFromValue, _framePositions, _frameValues = (
+    _loadTable(f'compact-{name}', lambda i=i: _buildCompactTables()[i],
+        shape, dtype, [CORNER_NAMES, EDGE_NAMES])
+    for i, (name, shape, dtype) in enumerate([
+        ('slot-positions', (_numSlots,), np.intp),
+        ('orientation-from-value', (_numSlots, NUM_ORIENTATIONS), np.uint8),
+        ('frame-positions', (NUM_ORIENTATIONS, _numSlots), np.intp),
+        ('frame-values', (NUM_ORIENTATIONS, _numSlots, NUM_ORIENTATIONS),
+            np.uint8)]))
+_slots = np.arange(_numSlots)
+
+def compactStates(states):
+    '''
+    Convert an array of flat cube states to compact ones: shape (..., 27) in,
+    (..., 20) uint8 out. Each compact state holds the 8 corners then the 12
+    edges, as piece * 3 + twist for corners and piece * 2 + flip for edges
+    (see CORNER_NAMES and EDGE_NAMES). Whole-cube rotations are factored out
+    first, so the result describes the cube as seen with its centers at
+    home.
+    '''
+    states = np.asarray(states)
+    frames = getFrames(states)[..., np.newaxis]
+    positions = _framePositions[frames, _slots]
+    return _frameValues[frames, _slots,
+        np.take_along_axis(states, positions, axis=-1)]
+
+def expandCompactStates(compact):
+    '''
+    The inverse of compactStates: shape (..., 20) in, (..., 27) out. The
+    results have their centers at home.
+    '''
+    compact = np.asarray(compact)
+    states = np.full(compact.shape[:-1] + (27,), CANONICAL_ORIENTATION,
+        dtype=np.uint8)
+    states[..., _slotPositions] = _orientationFromValue[_slots, compact]
+    return states
+
+class CompactCube(bytes):
+    '''
+    An immutable cube state holding only the 20 movable pieces, as a 20-byte
+    string laid out like a row of compactStates. Cheap to store, hash and
+    compare in bulk; convert to a Cube to turn it.
+
+    This is a bytes subclass with no per-object attributes, so each state
+    costs one small bytes object and nothing more; it hashes and compares
+    equal to its plain bytes.
+    '''
+
+    __slots__ = ()
+
+    def __new__(cls, pieces=None):
+        if pieces is None:
+            pieces = _solvedCompact
+        self = super().__new__(cls, pieces)
+        assert len(self) == NUM_CORNERS + NUM_EDGES
+        return self
+
+    @classmethod
+    def fromCube(cls, cube):
+        return cls(compactStates(cube.cubies.reshape(-1)).tobytes())
+
+    def toCube(self):
+        cube = Cube()
+        cube.cubies = expandCompactStates(self.toArray()).reshape(3, 3, 3)
+        return cube
+
+    def toArray(self):
+        return np.frombuffer(self, dtype=np.uint8)
+
+    @property
+    def pieces(self):
+        return bytes(self)
+
+    @property
+    def cornerPerm(self):
+        return [value // 3 for value in self[:NUM_CORNERS]]
+
+    @property
+    def cornerTwist(self):
+        return [value % 3 for value in self[:NUM_CORNERS]]
+
+    @property
+    def edgePerm(self):
+        return [value // 2 for value in self[NUM_CORNERS:]]
+
+    @property
+    def edgeFlip(self):
+        return [value % 2 for value in self[NUM_CORNERS:]]
+
+    def isSolved(self):
+        return self == _solvedCompact
+
+    def canonical(self):
+        '''
+        Return the representative of this state's symmetry class (see
+        Cube.canonicalKey).
+        '''
+        return CompactCube(canonicalCompactStates(self.toArray()).tobytes())
+
+    def __repr__(self):
+        return f'CompactCube({bytes(self)!r})'
+
+_solvedCompact = compactStates(
+    np.full(27, CANONICAL_ORIENTATION, dtype=np.uint8)).tobytes()
+
+
+
+########################################
+# Reading facelets
+#
+# Going from stickers back to a state: the U and F centers give the frame
+# (see getFrames), the other centers must agree with it, and the stickers on
+# each corner or edge slot pick out that cubie's orientation through a table
+# indexed by the faces they belong to. The result is then checked the way
+# any compact state can be: each piece present exactly once, corner twists
+# summing to 0 (mod 3), edge flips to 0 (mod 2), and the corner and edge
+# permutations of the same parity.
+
+# Error codes from parseFaceletArray, in the order they're checked
+FE_OK        = 0
+FE_LETTERS   = 1
+FE_CENTERS   = 2
+FE_PIECES    = 3
+FE_DUPLICATE = 4
+FE_TWIST     = 5
+FE_FLIP      = 6
+FE_PARITY    = 7
+
+FACELET_ERRORS = {
+    FE_OK        : 'valid',
+    FE_LETTERS   : 'not 54 letters from URFDLB',
+    FE_CENTERS   : 'the centers are not arranged as on a real cube',
+    FE_PIECES    : 'some piece has a combination of colors that does not '
+        'exist',
+    FE_DUPLICATE : 'some piece appears more than once',
+    FE_TWIST     : 'a corner is twisted',
+    FE_FLIP      : 'an edge is flipped',
+    FE_PARITY    : 'two pieces are swapped (permutation parity)',
+}
+
+# Stands for an unknown letter in the face tables below
+_NO_FACE = len(_faceToLetter)
+
+def _buildFaceletReadTables():
+    # Letter (as a byte) -> face, for URFDLB strings
+    letterFaces = np.full(256, _NO_FACE, dtype=np.uint8)
+    for face, letter in _faceToLetter.items():
+        letterFaces[ord(letter)] = face
+
+    base = _NO_FACE + 1
+    centerFacelets = np.array([faceletIndex(face, 1, 1)
+        for face in _centerFaces])
+
+    # frameFromCenters[U center's face, F center's face] -> frame, or
+    # NUM_ORIENTATIONS if there's no such frame; frameCenters[frame] -> the
+    # faces every center should show (all _NO_FACE for the missing frame).
+    frameFromCenters = np.full((base, base), NUM_ORIENTATIONS,
+        dtype=np.uint8)
+    frameCenters = np.full((NUM_ORIENTATIONS + 1, len(_centerFaces)),
+        _NO_FACE, dtype=np.uint8)
+    for frame in range(NUM_ORIENTATIONS):
+        faces = [_colorToFace[_orientationFaces[frame, face]]
+            for face in _centerFaces]
+        frameFromCenters[faces[F_U], faces[F_F]] = frame
+        frameCenters[frame] = faces
+
+    # For each corner and edge slot, its facelets (padded with the slot's
+    # first facelet for edges), and orientationFromKey[slot, key] -> the
+    # orientation of the cubie there, where key packs the faces of its
+    # stickers in base 7 (or NUM_ORIENTATIONS if no cubie shows those).
+    faceletAt = {}
+    for facelet, (position, face) in enumerate(
+            zip(_faceletPositions, _faceletFaces)):
+        faceletAt.setdefault(int(position), []).append((facelet, int(face)))
+    slotFacelets = np.zeros((len(_slotPositions), 3), dtype=np.intp)
+    orientationFromKey = np.full((len(_slotPositions), base ** 3),
+        NUM_ORIENTATIONS, dtype=np.uint8)
+    for slot, position in enumerate(_slotPositions):
+        stickers = faceletAt[int(position)]
+        stickers += stickers[:1] * (3 - len(stickers))
+        slotFacelets[slot] = [facelet for facelet, _ in stickers]
+        for orientation in range(NUM_ORIENTATIONS):
+            key = 0
+            for _, face in stickers:
+                key = key * base + \
+                    _colorToFace[_orientationFaces[orientation, face]]
+            orientationFromKey[slot, key] = orientation
+
+    return (letterFaces, centerFacelets, frameFromCenters, frameCenters,
+        slotFacelets, orientationFromKey)
+
+(_letterFaces, _centerFacelets, _frameFromCenterFaces, _frameCenterFaces,
+    _slotFacelets, _orientationFromKey) = _buildFaceletReadTables()
+# As with _faceletLetterOffsets, flattened so slot i, key k is at
+# _slotKeyOffsets[i] + k
+_slotKeyOffsets = np.arange(len(_slotPositions)) * \
+    _orientationFromKey.shape[1]
+_orientationFromKey = _orientationFromKey.reshape(-1)
+
+# The facelet drawn at each letter of a net, in reading order
+_netReadingOrder = np.argsort(_netSlots)
+_letterToColor = {letter: color for color, letter in _colorToLetter.items()}
+
+def permutationParity(perms):
+    '''
+    Return the parity (0 for even, 1 for odd) of each row of perms, an (N, n)
+    array of permutations of range(n).
+    '''
+    # Count inversions one pair of columns at a time, which needs no more
+    # memory than a column.
+    n = perms.shape[-1]
+    parity = np.zeros(perms.shape[:-1], dtype=np.uint8)
+    for i in range(n):
+        for j in range(i + 1, n):
+            parity ^= perms[..., i] > perms[..., j]
+    return parity
+
+def faceletArray(facelets):
+    '''
+    Convert a list of 54-character facelet strings (or bytes) to an (N, 54)
+    uint8 array of their letters. Strings of the wrong length or with
+    non-ASCII characters come out with a zero byte, which parseFaceletArray
+    rejects.
+    '''
+    if isinstance(facelets, np.ndarray) and facelets.dtype == np.uint8:
+        return facelets.reshape(-1, 54)
+    try:
+        strings = np.array(facelets, dtype=bytes).reshape(-1)
+    except UnicodeEncodeError:
+        # Only ASCII strings convert directly; the others can't be valid.
+        strings = np.array([string if isinstance(string, bytes) or
+                string.isascii() else b''
+            for string in np.ravel(facelets)], dtype=bytes)
+    width = max(strings.dtype.itemsize, 55)
+    letters = np.zeros((len(strings), width), dtype=np.uint8)
+    letters[:, :strings.dtype.itemsize] = \
+        strings.view(np.uint8).reshape(len(strings), -1)
+    letters[letters[:, 54:].any(axis=1), 0] = 0
+    return letters[:, :54]
+
+# Rows converted at a time by parseFaceletArray, so that the temporaries
+# stay small enough to be cache-friendly
+_FACELET_CHUNK_SIZE = 8192
+
+def parseFaceletArray(letters):
+    '''
+    Convert facelet strings, given as an (N, 54) uint8 array of their letters
+    (see faceletArray), to flat cube states. Return (states, errors): states
+    has shape (N, 27), and errors[i] is FE_OK if facelet string i describes
+    a reachable state, or else the FE_* code of its first problem (see
+    FACELET_ERRORS); rows of states that aren't FE_OK are meaningless.
+
+    The centers give the cube's orientation, so strings from rotated cubes
+    (as Cube.toFacelets writes them) come back rotated too. Invisible center
+    twists can't be recovered, and come back as none.
+    '''
+    letters = np.asarray(letters, dtype=np.uint8).reshape(-1, 54)
+    states = np.empty((len(letters), 27), dtype=np.uint8)
+    errors = np.empty(len(letters), dtype=np.uint8)
+    for start in range(0, len(letters), _FACELET_CHUNK_SIZE):
+        chunk = slice(start, start + _FACELET_CHUNK_SIZE)
+        states[chunk], errors[chunk] = _parseFaceletChunk(letters[chunk])
+    return states, errors
+
+def _parseFaceletChunk(letters):
+    faces = _letterFaces[letters]
+    errors = np.where((faces == _NO_FACE).any(axis=1), FE_LETTERS, FE_OK
+        ).astype(np.uint8)
+
+    centers = faces[:, _centerFacelets]
+    frames = _frameFromCenterFaces[centers[:, F_U], centers[:, F_F]]
+    badCenters = (centers != _frameCenterFaces[frames]).any(axis=1)
+    errors[(errors == FE_OK) & badCenters] = FE_CENTERS
+    frames[frames == NUM_ORIENTATIONS] = CANONICAL_ORIENTATION
+
+    base = _NO_FACE + 1
+    slotFaces = faces[:, _slotFacelets].astype(np.intp)
+    keys = (slotFaces[..., 0] * base + slotFaces[..., 1]) * base + \
+        slotFaces[..., 2] + _slotKeyOffsets
+    orientations = _orientationFromKey[keys]
+    badPieces = (orientations == NUM_ORIENTATIONS).any(axis=1)
+    errors[(errors == FE_OK) & badPieces] = FE_PIECES
+
+    states = np.repeat(frames[:, np.newaxis], 27, axis=1)
+    states[:, _slotPositions] = np.where(badPieces[:, np.newaxis],
+        frames[:, np.newaxis], orientations)
+
+    compact = compactStates(states)
+    corners = compact[:, :NUM_CORNERS]
+    edges = compact[:, NUM_CORNERS:]
+    cornerPerms = corners // 3
+    edgePerms = edges // 2
+    duplicates = \
+        (np.sort(cornerPerms, axis=1) != _slots[:NUM_CORNERS]).any(axis=1) | \
+        (np.sort(edgePerms, axis=1) != _slots[:NUM_EDGES]).any(axis=1)
+    for code, bad in [
+            (FE_DUPLICATE, duplicates),
+            (FE_TWIST, (corners % 3).sum(axis=1) % 3 != 0),
+            (FE_FLIP, (edges % 2).sum(axis=1) % 2 != 0),
+            (FE_PARITY, permutationParity(cornerPerms) !=
+                permutationParity(edgePerms))]:
+        errors[(errors == FE_OK) & bad] = code
+    return states, errors
+
+def netToFacelets(net):
+    '''
+    Convert a net, laid out as Cube.__repr__ prints it, to a URFDLB facelet
+    string. Only the order of the letters matters, not the spacing.
+    '''
+    letters = ''.join(net.split())
+    if len(letters) != 54:
+        raise ValueError(f'Expected 54 stickers in net, got {len(letters)}')
+    facelets = [None] * 54
+    for facelet, letter in zip(_netReadingOrder, letters):
+        color = _letterToColor.get(letter)
+        if color is None:
+            raise ValueError(f'Unknown color in net: {letter!r}')
+        facelets[facelet] = _faceToLetter[_colorToFace[color]]
+    return ''.join(facelets)
+
+
+
+########################################
+# Symmetry
+#
+# The 48 symmetries of the cube are the 3x3 signed permutation matrices: 24
+# rotations and their 24 mirror images. Conjugating a position X by a
+# symmetry S (S X S^-1) gives the same position seen in a rotated or mirrored
+# cube. On compact states, that moves the piece in each slot to a fixed other
+# slot and relabels it, so it's a gather plus a table lookup per symmetry.
+
+NUM_SYMMETRIES = 48
+
+@functools.lru_cache(maxsize=None)
+def _buildSymmetryTables():
+    faceVectors = {face: unpackColor(
+            _orientationFaces[CANONICAL_ORIENTATION, face])
+        for face in _faceToLetter}
+    vectorFaces = {tuple(vector): face for face, vector in faceVectors.items()}
+
+    pieceFaces = [[_letterToFace[letter] for letter in name]
+        for name in CORNER_NAMES + EDGE_NAMES]
+    # slot (overall) and faces, by the set of faces it's next to
+    slotBySet = {frozenset(faces): (slot, faces)
+        for slot, faces in enumerate(pieceFaces)}
+
+    matrices = []
+    for axes in itertools.permutations(range(3)):
+        for signs in itertools.product([1, -1], repeat=3):
+            matrix = np.zeros((3, 3), dtype=int)
+            matrix[range(3), axes] = signs
+            matrices.append(matrix)
+    assert len(matrices) == NUM_SYMMETRIES
+
+    # conjugate[s, target, value]: the value in slot target of S X S^-1,
+    # if slot source[s, target] of X holds value.
+    source = np.zeros((NUM_SYMMETRIES, len(pieceFaces)), dtype=np.intp)
+    conjugate = np.zeros((NUM_SYMMETRIES, len(pieceFaces), NUM_ORIENTATIONS),
+        dtype=np.uint8)
+    for sym, matrix in enumerate(matrices):
+        def mapFaces(faces):
+            return [vectorFaces[tuple(matrix @ faceVectors[face])]
+                for face in faces]
+        for slot, faces in enumerate(pieceFaces):
+            n = len(faces)
+            target, targetFaces = slotBySet[frozenset(mapFaces(faces))]
+            source[sym, target] = slot
+            base = 0 if n == 3 else NUM_CORNERS
+            for piece in range(24 // n):
+                # Map the piece's reference sticker, and the facelet of this
+                # slot that it's on.
+                newPiece, newPieceFaces = slotBySet[frozenset(
+                    mapFaces(pieceFaces[base + piece]))]
+                referenceIndex = newPieceFaces.index(
+                    mapFaces(pieceFaces[base + piece][:1])[0])
+                for turn in range(n):
+                    faceletIndex = targetFaces.index(
+                        mapFaces([faces[turn]])[0])
+                    newTurn = (faceletIndex - referenceIndex) % n
+                    conjugate[sym, target, piece * n + turn] = \
+                        (newPiece - base) * n + newTurn
+    return source, conjugate
+
+@functools.lru_cache(maxsize=None)
+def _symmetryTables():
+    # (source, conjugate) as built by _buildSymmetryTables. Only built (or
+    # loaded) on first use, since they take a while and few programs need
+    # them.
+    return tuple(_loadTable(f'symmetry-{name}',
+            lambda i=i: _buildSymmetryTables()[i], shape, dtype,
+            [CORNER_NAMES, EDGE_NAMES])
+        for i, (name, shape, dtype) in enumerate([
+            ('source', (NUM_SYMMETRIES, _numSlots), np.intp),
+            ('conjugate', (NUM_SYMMETRIES, _numSlots, NUM_ORIENTATIONS),
+                np.uint8)]))
+
+_symmetries = np.arange(NUM_SYMMETRIES)[:, np.newaxis]
+
+def conjugateCompactStates(compact):
+    '''
+    Return every symmetry-conjugate of an array of compact states: shape
+    (..., 20) in, (..., 48, 20) out. Symmetry 0 is the identity.
+    '''
+    compact = np.asarray(compact)
+    source, conjugate = _symmetryTables()
+    return conjugate[_symmetries, _slots, compact[..., source]]
+
+# States reduced at a time by canonicalCompactStates; each one expands to
+# 48 conjugates, so this keeps the temporaries to a few megabytes
+_CANONICAL_CHUNK_SIZE = 2048
+
+def canonicalCompactStates(compact):
+    '''
+    Reduce an array of compact states to the lexicographically smallest of
+    their symmetry-conjugates: shape (..., 20) in, (..., 20) out.
+    '''
+    compact = np.asarray(compact)
+    flat = compact.reshape(-1, compact.shape[-1])
+    canonical = np.empty(flat.shape, dtype=np.uint8)
+    for start in range(0, len(flat), _CANONICAL_CHUNK_SIZE):
+        chunk = slice(start, start + _CANONICAL_CHUNK_SIZE)
+        canonical[chunk] = _canonicalChunk(flat[chunk])
+    return canonical.reshape(compact.shape)
+
+def _canonicalChunk(compact):
+    conjugates = conjugateCompactStates(compact)
+    # Each value is under 32, so pack each half of a state into one integer
+    # (5 bits per value) and compare those.
+    high = (conjugates[..., :10].astype(np.uint64) * _packWeights).sum(axis=-1)
+    low  = (conjugates[..., 10:].astype(np.uint64) * _packWeights).sum(axis=-1)
+    low[high != high.min(axis=-1, keepdims=True)] = np.iinfo(np.uint64).max
+    best = low.argmin(axis=-1)[..., np.newaxis, np.newaxis]
+    return np.take_along_axis(conjugates, best, axis=-2)[..., 0, :]
+
+_packWeights = np.left_shift(np.uint64(1),
+    np.arange(45, -1, -5, dtype=np.uint64))
+
+
 ########################################
 
 if __name__ == '__main__':
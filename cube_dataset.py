@@ -0,0 +1,310 @@
+'''
+Large sets of cube states on disk, written and read in chunks.
+
+A dataset is a directory of .npy files: states.npy holds the compact states
+(see cube_cubies_take2.compactStates), one 20-byte row per cube, and each
+metadata column (a scramble length, a memo, ...) is another .npy file with
+one entry per cube. A small manifest, dataset.json, lists the columns, so
+that only the dataset's own files are ever read or replaced. The .npy files
+are plain .npy, so np.load works on them, but
+DatasetWriter appends to them as it goes rather than needing everything in
+memory first, and Dataset reads them memory-mapped, so nothing is loaded
+until it's used.
+'''
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from cube_cubies_take2 import (
+    CubeBatch, NUM_CORNERS, NUM_EDGES, compactStates, expandCompactStates)
+
+
+########################################
+# Driver code
+
+def main():
+    import argparse
+    import sys
+    import time
+    parser = argparse.ArgumentParser(
+        description='Write a dataset of uniformly random cube states.')
+    parser.add_argument('path', help='directory to write the dataset to')
+    parser.add_argument('count', type=int, help='number of states')
+    parser.add_argument('--seed', type=int, default=None,
+        help='seed for the random number generator')
+    parser.add_argument('--memos', action='store_true',
+        help='also store the blindfold memo for each state')
+    parser.add_argument('--overwrite', action='store_true',
+        help='replace the dataset already in path, if any')
+    args = parser.parse_args()
+    if os.path.isdir(args.path) and os.listdir(args.path) and \
+            not args.overwrite:
+        parser.error(f'{args.path} is not empty; use --overwrite to replace '
+            'the dataset in it')
+
+    # Imported here since only this driver needs them.
+    import cube_scramble
+    if args.memos:
+        import blindfold_cycles_trainer as trainer
+
+    columns = {}
+    if args.memos:
+        columns = {'edges': MEMO_DTYPE, 'parity': np.bool_,
+            'corners': MEMO_DTYPE}
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    with DatasetWriter(args.path, columns, args.overwrite) as writer:
+        for chunkStart in range(0, args.count, DEFAULT_CHUNK_SIZE):
+            size = min(DEFAULT_CHUNK_SIZE, args.count - chunkStart)
+            compact = cube_scramble.randomCompactStates(size, rng)
+            if args.memos:
+                edges, parity, corners = trainer.extractMemoArrays(
+                    expandCompactStates(compact))
+                writer.append(compact, edges=edges, parity=parity,
+                    corners=corners)
+            else:
+                writer.append(compact)
+    elapsed = time.perf_counter() - start
+    print(f'Wrote {args.count} states to {args.path} in {elapsed:.3f} s',
+        file=sys.stderr)
+
+
+########################################
+# Writing
+
+DEFAULT_CHUNK_SIZE = 65536
+
+STATES_NAME = 'states'
+
+MANIFEST_NAME = 'dataset.json'
+
+# Room for any memo from the trainer (whose longest possible edge memo is
+# under 24 letters)
+MEMO_DTYPE = np.dtype('S24')
+
+# Every .npy header we write takes exactly this many bytes, so it can be
+# rewritten in place as the row count grows.
+_HEADER_SIZE = 256
+
+def _npyHeader(dtype, shape):
+    # See the .npy format description in numpy.lib.format: magic string,
+    # version, header length, then a dict literal padded with spaces and
+    # ending in a newline.
+    header = repr({
+        'descr'         : np.lib.format.dtype_to_descr(dtype),
+        'fortran_order' : False,
+        'shape'         : shape,
+    })
+    prefix = np.lib.format.magic(1, 0)
+    headerLength = _HEADER_SIZE - len(prefix) - 2
+    if len(header) + 1 > headerLength:
+        raise ValueError(f'Column type too complicated to store: {dtype}')
+    return prefix + struct.pack('<H', headerLength) + \
+        (header.ljust(headerLength - 1) + '\n').encode('latin1')
+
+def _columnPath(path, name):
+    return os.path.join(path, name + '.npy')
+
+def _manifestPath(path):
+    return os.path.join(path, MANIFEST_NAME)
+
+def _readManifest(path):
+    # The names of the metadata columns of the dataset in path
+    with open(_manifestPath(path)) as f:
+        manifest = json.load(f)
+    return list(manifest['columns'])
+
+def _removeDataset(path):
+    # Remove the files of the dataset in path (if there is one), and
+    # nothing else.
+    try:
+        columns = _readManifest(path)
+    except FileNotFoundError:
+        return
+    for name in [STATES_NAME] + columns:
+        try:
+            os.unlink(_columnPath(path, name))
+        except FileNotFoundError:
+            pass
+    os.unlink(_manifestPath(path))
+
+class _ColumnFile:
+    '''
+    One growing .npy file: rows are appended to the end, and the header's
+    row count is only brought up to date by flush.
+    '''
+
+    def __init__(self, path, dtype, rowShape):
+        self.dtype = np.dtype(dtype)
+        self.rowShape = tuple(rowShape)
+        self.numRows = 0
+        self.file = open(path, 'wb')
+        self.file.write(_npyHeader(self.dtype, (0,) + self.rowShape))
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.shape[1:] != self.rowShape:
+            raise ValueError(f'Expected rows of shape {self.rowShape}, got '
+                f'{rows.shape[1:]}')
+        self.file.write(rows.data)
+        self.numRows += len(rows)
+
+    def flush(self):
+        self.file.flush()
+        end = self.file.tell()
+        self.file.seek(0)
+        self.file.write(_npyHeader(self.dtype, (self.numRows,) +
+            self.rowShape))
+        self.file.seek(end)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class DatasetWriter:
+    '''
+    Writes a dataset to the directory path, chunk by chunk. The directory is
+    created if need be; if it isn't empty, this raises FileExistsError
+    unless overwrite is true, in which case the dataset already there (as
+    listed in its manifest) is removed first, and any other files are left
+    alone. columns maps the name of each metadata column to its dtype, which
+    must have a fixed size (so use e.g. 'S24' for strings). Use as a context
+    manager, or call close when done:
+
+        with DatasetWriter('data', {'length': np.uint8}) as writer:
+            for states, lengths in chunks:
+                writer.append(states, length=lengths)
+
+    Everything appended so far is readable (as a complete, shorter dataset)
+    after each flush.
+    '''
+
+    def __init__(self, path, columns=None, overwrite=False):
+        columns = dict(columns or {})
+        if STATES_NAME in columns:
+            raise ValueError(f'{STATES_NAME!r} is not allowed as a column '
+                'name')
+        os.makedirs(path, exist_ok=True)
+        if os.listdir(path):
+            if not overwrite:
+                raise FileExistsError(f'{path} is not empty; pass '
+                    'overwrite=True to replace the dataset in it')
+            _removeDataset(path)
+        with open(_manifestPath(path), 'w') as f:
+            json.dump({'columns': list(columns)}, f)
+            f.write('\n')
+        self.path = path
+        self._states = _ColumnFile(_columnPath(path, STATES_NAME), np.uint8,
+            (NUM_CORNERS + NUM_EDGES,))
+        self._columns = {name: _ColumnFile(_columnPath(path, name), dtype, ())
+            for name, dtype in columns.items()}
+
+    def __len__(self):
+        return self._states.numRows
+
+    def append(self, states, **columns):
+        '''
+        Append a chunk of cubes. states is an array of compact states
+        (shape (N, 20)) or of flat states (shape (N, 27), as in
+        CubeBatch.states), and there must be an array of N values for each
+        metadata column.
+        '''
+        states = np.asarray(states)
+        if states.ndim != 2:
+            raise ValueError(f'Expected a 2D array of states, got shape '
+                f'{states.shape}')
+        if states.shape[1] == 27:
+            states = compactStates(states)
+        if set(columns) != set(self._columns):
+            raise ValueError(f'Expected columns {sorted(self._columns)}, '
+                f'got {sorted(columns)}')
+        for name, values in columns.items():
+            if len(values) != len(states):
+                raise ValueError(f'Column {name!r} has {len(values)} values '
+                    f'for {len(states)} states')
+        self._states.append(states)
+        for name, values in columns.items():
+            self._columns[name].append(values)
+
+    def appendBatch(self, batch, **columns):
+        '''
+        Append the cubes of a CubeBatch, as for append.
+        '''
+        self.append(batch.states, **columns)
+
+    def flush(self):
+        for column in [self._states] + list(self._columns.values()):
+            column.flush()
+
+    def close(self):
+        for column in [self._states] + list(self._columns.values()):
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+
+########################################
+# Reading
+
+class Dataset:
+    '''
+    A dataset written by DatasetWriter, memory-mapped read-only. states is
+    the (N, 20) array of compact states, and columns maps each metadata
+    column's name to its array; slicing any of them gives views, without
+    copying or reading more than is used.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.states = np.load(_columnPath(path, STATES_NAME), mmap_mode='r')
+        self.columns = {name: np.load(_columnPath(path, name), mmap_mode='r')
+            for name in _readManifest(path)}
+        for name, values in self.columns.items():
+            if len(values) != len(self.states):
+                raise ValueError(f'Column {name!r} of {path} has '
+                    f'{len(values)} rows, but there are {len(self.states)} '
+                    'states')
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def chunks(self, chunkSize=DEFAULT_CHUNK_SIZE):
+        '''
+        Yield (states, columns) for successive chunks of at most chunkSize
+        cubes: views of the compact states and of each column.
+        '''
+        for start in range(0, len(self), chunkSize):
+            chunk = slice(start, start + chunkSize)
+            yield self.states[chunk], {name: values[chunk]
+                for name, values in self.columns.items()}
+
+    def expandedStates(self, start=0, stop=None):
+        '''
+        Return the flat states (shape (N, 27)) of cubes start to stop.
+        '''
+        return expandCompactStates(self.states[start:stop])
+
+    def batch(self, start=0, stop=None):
+        '''
+        Return a CubeBatch of cubes start to stop.
+        '''
+        batch = CubeBatch(0)
+        batch.states = self.expandedStates(start, stop)
+        return batch
+
+
+########################################
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+'''
+Reading the input files that the command-line tools take.
+'''
+
+import contextlib
+import sys
+
+@contextlib.contextmanager
+def openInput(path, newline=None):
+    '''
+    Open a text file for reading, or use stdin if path is "-". Use as a
+    context manager; the file is closed afterwards, but stdin is left open.
+    '''
+    if path == '-':
+        yield sys.stdin
+        return
+    with open(path, newline=newline) as f:
+        yield f
+
+def readLines(path):
+    '''
+    Yield the non-blank lines of a file, or stdin if path is "-", with
+    surrounding whitespace stripped.
+    '''
+    with openInput(path) as f:
+        for line in f:
+            if line.strip():
+                yield line.strip()
@@ -0,0 +1,222 @@
+'''
+Cubes of any size from 2x2x2 up, modelled by their stickers.
+
+A layer turn only moves the stickers on that layer: the 4N around its edge,
+plus the N*N on the face itself for an outer layer. So rather than rotating
+the whole cube, each turn is a precomputed list of which stickers move where,
+applied with one fancy-indexing assignment.
+'''
+
+import functools
+import re
+
+import numpy as np
+
+from cube_cubies_take2 import (
+    Cube, F_U, F_L, F_F, F_R, F_B, F_D, FACE_LETTERS, FACELET_FACES, MT_FACE,
+    MT_WIDE, MT_SLICE, MT_ROTATION, concatFaces, faceGrid, faceLayer,
+    parseMove, rotateClockwise, splitAlg)
+
+
+########################################
+# Driver code
+
+def main():
+    import sys
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    cube = NxNCube(size)
+    cube.doMoves(' '.join(sys.argv[2:]) or "Rw U 2R' 3Fw2")
+    print(cube)
+
+
+########################################
+# Geometry
+#
+# Stickers are numbered face by face in URFDLB order (as in Cube.toFacelets),
+# each face row by row as drawn in the net. Each sticker is on one cubie
+# position of the N x N x N grid (laid out like Cube.cubies), facing out
+# through one face.
+
+MIN_SIZE = 2
+
+@functools.lru_cache(maxsize=None)
+def _stickerGeometry(size):
+    '''
+    Return (stickerPositions, stickerFaces, stickerAt): the flat cubie
+    position and face of each sticker, and an (N**3, 6) array giving the
+    sticker on each side of each cubie (or -1 if that side is hidden).
+    '''
+    positions = np.arange(size ** 3).reshape((size,) * 3)
+    stickerPositions = np.concatenate([faceGrid(positions, face).reshape(-1)
+        for face in FACELET_FACES])
+    stickerFaces = np.repeat(FACELET_FACES, size * size)
+    stickerAt = np.full((size ** 3, len(FACELET_FACES)), -1, dtype=np.intp)
+    stickerAt[stickerPositions, stickerFaces] = np.arange(len(stickerFaces))
+    return stickerPositions, stickerFaces, stickerAt
+
+@functools.lru_cache(maxsize=None)
+def _rotationFaceSources(face, numQuarterTurns):
+    # sources[g]: the face whose side ends up facing g after turning
+    # clockwise about face.
+    cube = Cube()
+    cube.rotateWholeCube(face, numQuarterTurns)
+    sources = [None] * len(FACELET_FACES)
+    for original, current in enumerate(cube.currentFaces()):
+        sources[current] = original
+    return np.array(sources)
+
+@functools.lru_cache(maxsize=None)
+def layerTurn(size, face, depth, numQuarterTurns):
+    '''
+    Return (targets, sources), arrays of sticker numbers such that turning
+    the layer depth layers in from face clockwise by numQuarterTurns moves
+    the sticker at sources[i] to targets[i]. Only stickers that move are
+    included.
+    '''
+    _, _, stickerAt = _stickerGeometry(size)
+    positions = np.arange(size ** 3).reshape((size,) * 3)
+    rotated = rotateClockwise(positions, face, numQuarterTurns)
+    layer = faceLayer(face, depth, size)
+    # Cubie layer[i] gets the cubie from rotated[layer][i], with its sides
+    # turned along with it.
+    targetCubies = positions[layer].reshape(-1)
+    sourceCubies = rotated[layer].reshape(-1)
+    faceSources = _rotationFaceSources(face, numQuarterTurns % 4)
+    targets = stickerAt[targetCubies]
+    sources = stickerAt[sourceCubies[:, np.newaxis], faceSources]
+    visible = targets >= 0
+    targets = targets[visible]
+    sources = sources[visible]
+    moved = targets != sources
+    return targets[moved], sources[moved]
+
+
+########################################
+# Moves
+#
+# On top of the 3x3x3 notation (see parseMove), a move can start with a
+# number of layers: "3Rw" turns the 3 outermost layers on the right, and
+# "3R" turns just the third layer in from the right. M, E and S turn the
+# middle layer, so they only make sense for odd sizes.
+
+_layerPrefixRe = re.compile(r'(\d*)(.+)')
+
+def parseLayerMove(move, size):
+    '''
+    Parse one move for a cube of the given size. Return (face, depths,
+    numTurns): the face to turn about, the depths from it of the layers to
+    turn, and the number of clockwise quarter turns.
+    '''
+    prefix, rest = _layerPrefixRe.fullmatch(move).groups()
+    moveType, face, numTurns = parseMove(rest)
+    layers = int(prefix) if prefix else None
+    if layers is not None and moveType not in (MT_FACE, MT_WIDE):
+        raise ValueError(f'Unexpected layer count in move: {move!r}')
+
+    if moveType == MT_FACE:
+        depths = ((layers or 1) - 1,)
+    elif moveType == MT_WIDE:
+        depths = tuple(range(layers or 2))
+    elif moveType == MT_SLICE:
+        if size % 2 == 0:
+            raise ValueError(f'No middle layer on a {size}x{size}x{size} '
+                f'cube: {move!r}')
+        depths = (size // 2,)
+    else:
+        assert moveType == MT_ROTATION
+        depths = tuple(range(size))
+
+    if not depths or max(depths) >= size or min(depths) < 0:
+        raise ValueError(f'Move {move!r} needs more than {size} layers')
+    return face, depths, numTurns
+
+@functools.lru_cache(maxsize=4096)
+def compileLayerMove(move, size):
+    '''
+    Return (targets, sources) for a whole move, as layerTurn does for one
+    layer. The layers of a move never share stickers, so this is just their
+    concatenation.
+    '''
+    face, depths, numTurns = parseLayerMove(move, size)
+    turns = [layerTurn(size, face, depth, numTurns % 4) for depth in depths]
+    return (np.concatenate([targets for targets, _ in turns]),
+        np.concatenate([sources for _, sources in turns]))
+
+
+########################################
+# The cube
+
+class NxNCube:
+    def __init__(self, size):
+        if size < MIN_SIZE:
+            raise ValueError(f'Cube size must be at least {MIN_SIZE}')
+        self.size = size
+        # The face (F_* constant) each sticker's color belongs to
+        self.stickers = np.repeat(np.array(FACELET_FACES, dtype=np.uint8),
+            size * size)
+
+    def doMoves(self, moves):
+        '''
+        Do a sequence of moves, given as for Cube.doMoves but with optional
+        layer counts (see parseLayerMove).
+        '''
+        for move in splitAlg(moves):
+            self.doOneMove(move)
+
+    def doOneMove(self, move):
+        targets, sources = compileLayerMove(move, self.size)
+        self.stickers[targets] = self.stickers[sources]
+
+    def turnLayer(self, face, depth, numQuarterTurns=1):
+        '''
+        Turn the single layer depth layers in from face (0 being the face
+        itself) clockwise about that face.
+        '''
+        targets, sources = layerTurn(self.size, face, depth,
+            numQuarterTurns % 4)
+        self.stickers[targets] = self.stickers[sources]
+
+    def isSolved(self):
+        faces = self.stickers.reshape(len(FACELET_FACES), -1)
+        return bool((faces == faces[:, :1]).all())
+
+    def faceStickers(self, face):
+        '''
+        Return the N x N array of stickers (as F_* constants) on one face,
+        arranged as it's drawn in the net.
+        '''
+        i = FACELET_FACES.index(face)
+        n = self.size
+        return self.stickers[i * n * n:(i + 1) * n * n].reshape(n, n)
+
+    def toFacelets(self):
+        '''
+        Return the facelet string: as Cube.toFacelets, but with N*N letters
+        per face.
+        '''
+        return ''.join(FACE_LETTERS[sticker] for sticker in self.stickers)
+
+    def __repr__(self):
+        faceStrs = {face: '\n'.join(
+                ' '.join(_colorLetters[sticker] for sticker in row)
+                for row in self.faceStickers(face))
+            for face in FACELET_FACES}
+        emptyFace = '\n'.join([' ' * (2 * self.size - 1)] * self.size)
+        return concatFaces([emptyFace, faceStrs[F_U]]) + '\n\n' + \
+            concatFaces([faceStrs[F_L], faceStrs[F_F], faceStrs[F_R],
+                faceStrs[F_B]]) + '\n\n' + \
+            concatFaces([emptyFace, faceStrs[F_D]])
+
+def _buildColorLetters():
+    # The color letters the 3x3x3 Cube prints for each face when solved
+    cube = Cube()
+    return {face: cube.faceToString(face, faceGrid(cube.cubies, face))[0]
+        for face in FACELET_FACES}
+
+_colorLetters = _buildColorLetters()
+
+
+########################################
+
+if __name__ == '__main__':
+    main()
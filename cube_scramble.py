@@ -0,0 +1,130 @@
+'''
+Uniformly random cube states, generated directly in vectorized batches rather
+than by doing random moves.
+
+A state is reachable exactly when the corner and edge permutations have the
+same parity, the corner twists sum to a multiple of 3, and the edge flips
+sum to a multiple of 2. So we pick everything else freely and fix up the
+last few values to match, which keeps the distribution uniform.
+'''
+
+import sys
+
+import numpy as np
+
+from cube_cubies_take2 import (
+    Cube, CubeBatch, NUM_CORNERS, NUM_EDGES, expandCompactStates,
+    permutationParity)
+
+
+########################################
+# Driver code
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(
+        description='Generate uniformly random cube states.')
+    parser.add_argument('count', type=int, nargs='?', default=1,
+        help='number of states (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+        help='seed for the random number generator')
+    parser.add_argument('--scrambles', action='store_true',
+        help='print a scramble for each state (slow: solves each one), '
+            'instead of its facelet string')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.scrambles:
+        for _ in range(args.count):
+            print(randomScramble(rng))
+        return
+
+    start = time.perf_counter()
+    batch = randomBatch(args.count, rng)
+    elapsed = time.perf_counter() - start
+    for facelets in batch.toFacelets():
+        print(facelets)
+    print(f'Generated {args.count} states in {elapsed:.3f} s',
+        file=sys.stderr)
+
+
+########################################
+# Random states
+
+def _rng(seed):
+    # Accept a Generator (to continue its stream) or anything default_rng
+    # takes as a seed.
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+def _randomOrientations(rng, count, numPieces, modulus):
+    orientations = rng.integers(0, modulus, size=(count, numPieces),
+        dtype=np.uint8)
+    orientations[:, -1] = (-orientations[:, :-1].sum(axis=1, dtype=np.int64)
+        % modulus)
+    return orientations
+
+def randomCompactStates(count, seed=None):
+    '''
+    Return a (count, 20) array of uniformly random reachable states, in the
+    layout of cube_cubies_take2.compactStates. seed is passed to
+    np.random.default_rng, or may be a Generator to draw from.
+    '''
+    rng = _rng(seed)
+    cornerPerms = rng.permuted(
+        np.tile(np.arange(NUM_CORNERS, dtype=np.uint8), (count, 1)), axis=1)
+    edgePerms = rng.permuted(
+        np.tile(np.arange(NUM_EDGES, dtype=np.uint8), (count, 1)), axis=1)
+    # Where the parities don't match, swap the last two edges. That maps the
+    # odd edge permutations one-to-one onto the even ones (and back), so the
+    # result is still uniform.
+    mismatched = permutationParity(cornerPerms) != \
+        permutationParity(edgePerms)
+    edgePerms[mismatched, -2:] = edgePerms[mismatched, :-3:-1]
+
+    twists = _randomOrientations(rng, count, NUM_CORNERS, 3)
+    flips = _randomOrientations(rng, count, NUM_EDGES, 2)
+    return np.concatenate([cornerPerms * 3 + twists, edgePerms * 2 + flips],
+        axis=1)
+
+def randomStates(count, seed=None):
+    '''
+    Like randomCompactStates, but return flat cube states: shape (count, 27),
+    as in CubeBatch.states.
+    '''
+    return expandCompactStates(randomCompactStates(count, seed))
+
+def randomBatch(count, seed=None):
+    '''
+    Return a CubeBatch of count uniformly random states.
+    '''
+    batch = CubeBatch(0)
+    batch.states = randomStates(count, seed)
+    return batch
+
+def randomCube(seed=None):
+    '''
+    Return a Cube in a uniformly random state.
+    '''
+    cube = Cube()
+    cube.cubies = randomStates(1, seed).reshape(3, 3, 3)
+    return cube
+
+def randomScramble(seed=None):
+    '''
+    Return a scramble (a string of moves) that takes a solved cube to a
+    uniformly random state. This has to solve the state, so it is much
+    slower than generating states.
+    '''
+    # Imported here since the solver's tables are only needed for this.
+    import cube_algorithms
+    import cube_solver
+    return cube_algorithms.invert(cube_solver.solve(randomCube(seed)))
+
+
+########################################
+
+if __name__ == '__main__':
+    main()
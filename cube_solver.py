@@ -0,0 +1,715 @@
+'''
+A two-phase (Kociemba) solver for the cube model in cube_cubies_take2.
+
+Phase 1 takes the cube into the subgroup G1 = <U, D, R2, L2, F2, B2>, where
+every piece is oriented and the middle-layer edges are in the middle layer.
+Phase 2 solves it using only moves from G1. Each phase is an IDA* search
+over a few small coordinates, guided by pruning tables that give a lower
+bound on the number of moves left.
+
+All the tables are built on first use and cached on disk (see table_cache),
+so later runs just memory-map them.
+'''
+
+import concurrent.futures
+import functools
+import itertools
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from cube_cubies_take2 import (
+    FACE_LETTERS, Cube, CompactCube, F_U, F_L, F_F, F_R, F_B, F_D,
+    NUM_CORNERS, NUM_EDGES, compactStates)
+from cube_io import readLines
+import table_cache
+
+
+########################################
+# Driver code / self-tests
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Find a short solution for a scrambled cube.')
+    parser.add_argument('scramble', nargs='*',
+        help='the scramble, in the notation Cube.doMoves accepts')
+    parser.add_argument('--batch', metavar='FILE',
+        help='solve every scramble in FILE (one per line), or stdin if FILE '
+            'is -, printing a JSON line for each as it finishes')
+    parser.add_argument('--workers', type=int, default=None,
+        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--parallel', action='store_true',
+        help='split the search for a single scramble across the workers')
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH,
+        help='longest solution to accept (default %(default)s)')
+    parser.add_argument('--target-length', type=int,
+        default=DEFAULT_TARGET_LENGTH,
+        help='keep looking for shorter solutions until one is this long or '
+            'shorter (default %(default)s)')
+    parser.add_argument('--max-nodes', type=int, default=DEFAULT_MAX_NODES,
+        help='...or until this many search nodes have been visited '
+            '(default %(default)s)')
+    parser.add_argument('--extra-depth', type=int, default=0,
+        help='in any case, search this many phase 1 levels past the first '
+            'solution (slow; default %(default)s)')
+    parser.add_argument('--self-test', action='store_true',
+        help='check that the solver works, then exit')
+    args = parser.parse_args()
+
+    if args.self_test:
+        selfTest()
+        return
+
+    options = dict(maxLength=args.max_length, extraDepth=args.extra_depth,
+        targetLength=args.target_length, maxNodes=args.max_nodes)
+    if args.batch is not None:
+        batchMain(args.batch, args.workers, **options)
+        return
+    if not args.scramble:
+        parser.error('give a scramble, or --batch FILE')
+
+    scramble = ' '.join(args.scramble)
+    if args.parallel:
+        solution = solveParallel(scramble, args.workers, **options)
+    else:
+        solution = solve(scramble, **options)
+    if solution is None:
+        print(f'No solution of {args.max_length} moves or fewer',
+            file=sys.stderr)
+        sys.exit(1)
+    print(solution)
+
+def selfTest():
+    # Solutions solve the cube, within the limits asked for
+    for scramble, maxLength, targetLength in [
+            ("", 0, 0),
+            ("R U R' U'", 4, 4),
+            ("R U F' L2 D B R' U2 F D' L B2", 23, 22),
+            ("D B2 D L2 U R2 L2 U' B2 F2 L F' U B D B R2 L U L' B'", 23, 23)]:
+        cube = _cubeAfter(scramble)
+        solution = solve(cube, maxLength, targetLength=targetLength,
+            maxNodes=None)
+        assert len(solution.split()) <= targetLength
+        cube.doMoves(solution)
+        assert cube.isSolved()
+    # The node budget stops the search for shorter solutions, not the search
+    # for a first one
+    solution = solve("R U F' L2 D B R' U2 F D' L B2", targetLength=0,
+        maxNodes=1)
+    assert _cubeAfter("R U F' L2 D B R' U2 F D' L B2 " + solution).isSolved()
+    assert solve("R U F2", maxLength=2) is None
+
+
+########################################
+# Moves
+#
+# Only face turns are used while searching. Move m turns face m // 3 by
+# m % 3 + 1 quarter turns.
+
+DEFAULT_MAX_LENGTH = 23
+
+# By default, the search keeps looking for shorter solutions until it finds
+# one of at most DEFAULT_TARGET_LENGTH moves (every cube has one of 20 or
+# fewer), or has visited DEFAULT_MAX_NODES search nodes since starting.
+DEFAULT_TARGET_LENGTH = 20
+DEFAULT_MAX_NODES = 2000000
+
+# Bump this whenever any table would come out differently.
+TABLE_VERSION = 1
+
+_axis = {F_U: 0, F_D: 0, F_L: 1, F_R: 1, F_F: 2, F_B: 2}
+_turnSuffixes = ['', '2', "'"]
+
+NUM_MOVES = 3 * len(FACE_LETTERS)
+_moveFaces = [m // 3 for m in range(NUM_MOVES)]
+_moveNames = [FACE_LETTERS[m // 3] + _turnSuffixes[m % 3]
+    for m in range(NUM_MOVES)]
+
+# The moves that stay in G1: quarter or half turns of U and D, half turns of
+# everything else.
+_phase2Moves = [m for m in range(NUM_MOVES)
+    if _moveFaces[m] in (F_U, F_D) or m % 3 == 1]
+
+def _canFollow(move, lastMove):
+    '''
+    Whether move is worth trying right after lastMove (None at the start).
+    Turning the same face twice in a row is never useful, and turns of
+    opposite faces commute, so only allow them in one order.
+    '''
+    if lastMove is None:
+        return True
+    face = _moveFaces[move]
+    lastFace = _moveFaces[lastMove]
+    if face == lastFace:
+        return False
+    return _axis[face] != _axis[lastFace] or face > lastFace
+
+_followTable = [[m for m in range(NUM_MOVES) if _canFollow(m, last)]
+    for last in [None] + list(range(NUM_MOVES))]
+
+def _allowedMoves(lastMove, moves):
+    allowed = _followTable[0 if lastMove is None else lastMove + 1]
+    return [m for m in moves if m in allowed]
+
+@functools.lru_cache(maxsize=None)
+def _moveCubes():
+    '''
+    (corner perm, corner twist, edge perm, edge flip) arrays for each move,
+    applied to a solved cube. Shapes (18, 8) and (18, 12).
+    '''
+    compact = np.array([compactStates(cube.cubies.reshape(-1))
+        for cube in map(_cubeAfter, _moveNames)])
+    corners = compact[:, :NUM_CORNERS]
+    edges = compact[:, NUM_CORNERS:]
+    return corners // 3, corners % 3, edges // 2, edges % 2
+
+def _cubeAfter(moves):
+    cube = Cube()
+    cube.doMoves(moves)
+    return cube
+
+
+########################################
+# Coordinates
+#
+# Each coordinate numbers the possible values of some part of the state. The
+# encoders take arrays of pieces (one state per row) so the move tables can
+# be built for every value at once; the decoders give a representative state
+# for each value.
+
+NUM_TWISTS = 3 ** (NUM_CORNERS - 1)
+NUM_FLIPS  = 2 ** (NUM_EDGES - 1)
+# Which 4 slots hold the UD-slice edges (FR, FL, BL, BR): 12 choose 4
+NUM_SLICES = math.comb(NUM_EDGES, 4)
+NUM_CORNER_PERMS  = math.factorial(NUM_CORNERS)
+NUM_UD_EDGE_PERMS = math.factorial(8)
+NUM_SLICE_PERMS   = math.factorial(4)
+
+_sliceEdges = np.arange(8, NUM_EDGES)
+
+def _digits(values, base, count):
+    # Most significant digit first
+    powers = base ** np.arange(count - 1, -1, -1)
+    return np.asarray(values)[..., np.newaxis] // powers % base
+
+def _undigits(digits, base):
+    count = digits.shape[-1]
+    return digits @ (base ** np.arange(count - 1, -1, -1))
+
+def encodeTwist(twist):
+    return _undigits(twist[..., :-1], 3)
+
+def decodeTwist(coords):
+    digits = _digits(coords, 3, NUM_CORNERS - 1)
+    return np.concatenate([digits, -digits.sum(-1, keepdims=True) % 3], -1)
+
+def encodeFlip(flip):
+    return _undigits(flip[..., :-1], 2)
+
+def decodeFlip(coords):
+    digits = _digits(coords, 2, NUM_EDGES - 1)
+    return np.concatenate([digits, digits.sum(-1, keepdims=True) % 2], -1)
+
+_sliceCombinations = np.array(
+    list(itertools.combinations(range(NUM_EDGES), 4)))
+# slice coordinate by bitmask of the slots holding slice edges
+_sliceFromMask = np.zeros(1 << NUM_EDGES, dtype=np.int64)
+_sliceFromMask[(1 << _sliceCombinations).sum(-1)] = np.arange(NUM_SLICES)
+
+def encodeSlice(edgePerm):
+    mask = np.isin(edgePerm, _sliceEdges)
+    return _sliceFromMask[mask @ (1 << np.arange(NUM_EDGES))]
+
+def decodeSlice(coords):
+    # Slice edges in order in the chosen slots, the others in order around
+    # them.
+    edgePerm = np.zeros((len(coords), NUM_EDGES), dtype=np.int64)
+    for row, slots in enumerate(_sliceCombinations[coords]):
+        others = [slot for slot in range(NUM_EDGES) if slot not in slots]
+        edgePerm[row, slots] = _sliceEdges
+        edgePerm[row, others] = np.arange(8)
+    return edgePerm
+
+# SLICE_SOLVED is where the slice edges are at home: the one value phase 1
+# is aiming for.
+SLICE_SOLVED = int(encodeSlice(np.arange(NUM_EDGES)))
+
+def encodePerm(perm):
+    '''
+    Lexicographic rank of each row of perm, among permutations of
+    range(perm.shape[-1]).
+    '''
+    n = perm.shape[-1]
+    smallerAfter = np.triu(
+        perm[..., np.newaxis, :] < perm[..., :, np.newaxis], k=1).sum(-1)
+    factorials = np.array([math.factorial(n - 1 - i) for i in range(n)])
+    return smallerAfter @ factorials
+
+@functools.lru_cache(maxsize=None)
+def _allPerms(n):
+    return np.array(list(itertools.permutations(range(n))))
+
+def decodePerm(coords, n):
+    return _allPerms(n)[coords]
+
+
+########################################
+# Move tables
+#
+# moveTable[coord, m] is the coordinate after doing move m. (Phase 2 tables
+# only have columns for _phase2Moves.)
+
+def _twistMoveTable():
+    cornerPerm, cornerTwist, _, _ = _moveCubes()
+    twist = decodeTwist(np.arange(NUM_TWISTS))
+    return np.stack([encodeTwist((twist[:, cornerPerm[m]] + cornerTwist[m])
+            % 3) for m in range(NUM_MOVES)], axis=1).astype(np.uint16)
+
+def _flipMoveTable():
+    _, _, edgePerm, edgeFlip = _moveCubes()
+    flip = decodeFlip(np.arange(NUM_FLIPS))
+    return np.stack([encodeFlip((flip[:, edgePerm[m]] + edgeFlip[m]) % 2)
+        for m in range(NUM_MOVES)], axis=1).astype(np.uint16)
+
+def _sliceMoveTable():
+    _, _, edgePerm, _ = _moveCubes()
+    edges = decodeSlice(np.arange(NUM_SLICES))
+    return np.stack([encodeSlice(edges[:, edgePerm[m]])
+        for m in range(NUM_MOVES)], axis=1).astype(np.uint16)
+
+def _cornerPermMoveTable():
+    cornerPerm, _, _, _ = _moveCubes()
+    perms = decodePerm(np.arange(NUM_CORNER_PERMS), NUM_CORNERS)
+    return np.stack([encodePerm(perms[:, cornerPerm[m]])
+        for m in _phase2Moves], axis=1).astype(np.uint16)
+
+def _udEdgePermMoveTable():
+    # Phase 2 moves keep the U and D layer edges in slots 0-7.
+    _, _, edgePerm, _ = _moveCubes()
+    perms = decodePerm(np.arange(NUM_UD_EDGE_PERMS), 8)
+    return np.stack([encodePerm(perms[:, edgePerm[m, :8]])
+        for m in _phase2Moves], axis=1).astype(np.uint16)
+
+def _slicePermMoveTable():
+    _, _, edgePerm, _ = _moveCubes()
+    perms = decodePerm(np.arange(NUM_SLICE_PERMS), 4) + 8
+    return np.stack([encodePerm(perms[:, edgePerm[m, 8:] - 8] - 8)
+        for m in _phase2Moves], axis=1).astype(np.uint16)
+
+
+########################################
+# Pruning tables
+#
+# Each pruning table is indexed by a pair of coordinates, a * sizeB + b, and
+# holds the fewest moves needed to bring both to their solved values. They
+# are filled in by a breadth-first search from the solved state, vectorized
+# over each layer of the search.
+
+UNVISITED = 255
+
+def _pruningTable(moveA, moveB, solvedA, solvedB):
+    sizeB = len(moveB)
+    table = np.full(len(moveA) * sizeB, UNVISITED, dtype=np.uint8)
+    table[solvedA * sizeB + solvedB] = 0
+    depth = 0
+    while True:
+        frontier = np.flatnonzero(table == depth)
+        if len(frontier) == 0:
+            return table
+        a, b = np.divmod(frontier, sizeB)
+        for m in range(moveA.shape[1]):
+            neighbors = moveA[a, m].astype(np.int64) * sizeB + moveB[b, m]
+            table[neighbors[table[neighbors] == UNVISITED]] = depth + 1
+        depth += 1
+
+
+########################################
+# Table loading
+
+class SolverTables:
+    '''
+    All the tables the search needs, memory-mapped. The search reads them
+    through flat memoryviews, since indexing those gives plain ints and is
+    much faster than indexing numpy arrays one element at a time.
+    '''
+
+    def __init__(self):
+        def load(name, build, shape, dtype):
+            # The move set is part of the cache key, so changing it can't
+            # pick up stale tables.
+            return table_cache.loadTable('solver-' + name, TABLE_VERSION,
+                build, shape, dtype, [_moveNames, _phase2Moves])
+
+        numPhase2Moves = len(_phase2Moves)
+        self.arrays = {}
+        for name, build, numCoords, numMoves in [
+                ('twist-move',       _twistMoveTable, NUM_TWISTS, NUM_MOVES),
+                ('flip-move',        _flipMoveTable,  NUM_FLIPS,  NUM_MOVES),
+                ('slice-move',       _sliceMoveTable, NUM_SLICES, NUM_MOVES),
+                ('corner-perm-move', _cornerPermMoveTable, NUM_CORNER_PERMS,
+                    numPhase2Moves),
+                ('ud-edge-perm-move', _udEdgePermMoveTable, NUM_UD_EDGE_PERMS,
+                    numPhase2Moves),
+                ('slice-perm-move',  _slicePermMoveTable, NUM_SLICE_PERMS,
+                    numPhase2Moves)]:
+            self.arrays[name] = load(name, build, (numCoords, numMoves),
+                np.uint16)
+
+        arrays = self.arrays
+        for name, moveA, moveB, solvedA, solvedB in [
+                ('twist-slice-prune', 'twist-move', 'slice-move',
+                    0, SLICE_SOLVED),
+                ('flip-slice-prune', 'flip-move', 'slice-move',
+                    0, SLICE_SOLVED),
+                ('corner-slice-prune', 'corner-perm-move', 'slice-perm-move',
+                    0, 0),
+                ('edge-slice-prune', 'ud-edge-perm-move', 'slice-perm-move',
+                    0, 0)]:
+            arrays[name] = load(name, functools.partial(_pruningTable,
+                    arrays[moveA], arrays[moveB], solvedA, solvedB),
+                (len(arrays[moveA]) * len(arrays[moveB]),), np.uint8)
+
+        def flat(name):
+            return memoryview(arrays[name]).cast('B').cast(
+                arrays[name].dtype.char)
+
+        self.twistMove      = flat('twist-move')
+        self.flipMove       = flat('flip-move')
+        self.sliceMove      = flat('slice-move')
+        self.cornerPermMove = flat('corner-perm-move')
+        self.udEdgePermMove = flat('ud-edge-perm-move')
+        self.slicePermMove  = flat('slice-perm-move')
+        self.twistSlicePrune  = flat('twist-slice-prune')
+        self.flipSlicePrune   = flat('flip-slice-prune')
+        self.cornerSlicePrune = flat('corner-slice-prune')
+        self.edgeSlicePrune   = flat('edge-slice-prune')
+
+@functools.lru_cache(maxsize=None)
+def getTables():
+    '''
+    Return the SolverTables for this process, loading (or on the very first
+    run, building) them if needed.
+    '''
+    return SolverTables()
+
+
+########################################
+# Search
+
+def solve(cube, maxLength=DEFAULT_MAX_LENGTH, extraDepth=0,
+        targetLength=DEFAULT_TARGET_LENGTH, maxNodes=DEFAULT_MAX_NODES):
+    '''
+    Return a solution for cube (a Cube, or a scramble string to apply to a
+    solved one) as a string of moves for Cube.doMoves, using at most
+    maxLength moves; or None if there is no such solution. If the cube has
+    been rotated, the moves are named after the faces its centers are on
+    now, so they can be applied to it directly.
+
+    Once a solution is found, the search goes on through longer phase 1
+    lengths, looking for shorter solutions, until it has one of at most
+    targetLength moves or has visited maxNodes search nodes (None for no
+    limit); so targetLength=maxLength gives the first solution found, and a
+    low targetLength with maxNodes=None gives the shortest one this search
+    can find, very slowly. The search always goes at least extraDepth phase
+    1 lengths past the first solution, each of which costs several times as
+    much as everything before it.
+    '''
+    if isinstance(cube, str):
+        cube = _cubeAfter(cube)
+    moves = solveCompact(CompactCube.fromCube(cube), maxLength, extraDepth,
+        targetLength, maxNodes)
+    return _movesToString(cube, moves)
+
+def _movesToString(cube, moves):
+    if moves is None:
+        return None
+    currentFaces = cube.currentFaces()
+    return ' '.join(FACE_LETTERS[currentFaces[_moveFaces[m]]] +
+        _turnSuffixes[m % 3] for m in moves)
+
+def solveCompact(compact, maxLength=DEFAULT_MAX_LENGTH, extraDepth=0,
+        targetLength=DEFAULT_TARGET_LENGTH, maxNodes=DEFAULT_MAX_NODES):
+    '''
+    Return a solution for a CompactCube (with its centers at home) as a list
+    of move indices, or None if there isn't one of at most maxLength moves.
+    See solve for the other arguments.
+    '''
+    return _Search(getTables(), compact, maxLength, extraDepth, targetLength,
+        maxNodes).run()
+
+def phase1Coords(compact):
+    '''
+    Return (twist, flip, slice) for a CompactCube.
+    '''
+    pieces = compact.toArray().astype(np.int64)
+    edges = pieces[NUM_CORNERS:]
+    return (int(encodeTwist(pieces[:NUM_CORNERS] % 3)),
+        int(encodeFlip(edges % 2)), int(encodeSlice(edges // 2)))
+
+class _Search:
+    def __init__(self, tables, compact, maxLength, extraDepth, targetLength,
+            maxNodes):
+        self.tables = tables
+        self.maxLength = maxLength
+        self.extraDepth = extraDepth
+        self.targetLength = targetLength
+        self.maxNodes = maxNodes
+        self.nodes = 0
+        self.cornerPerm = compact.cornerPerm
+        self.edgePerm = compact.edgePerm
+        self.phase1 = phase1Coords(compact)
+
+        cornerPerms, _, edgePerms, _ = _moveCubes()
+        self.moveCornerPerms = cornerPerms.tolist()
+        self.moveEdgePerms = edgePerms.tolist()
+        self.phase2Index = {m: i for i, m in enumerate(_phase2Moves)}
+
+    def run(self, firstMoves=None, depths=None):
+        '''
+        Search for phase 1 solutions of increasing length, trying to finish
+        each one with phase 2 within the overall limit. Once something is
+        found, the search goes on with a tighter limit until the solution is
+        good enough (see solve), and the shortest result is returned. If
+        firstMoves is given, only phase 1 solutions starting with one of
+        those moves are considered, and if depths is given, only phase 1
+        solutions of those lengths, so that the search can be split up
+        between workers.
+        '''
+        twist, flip, slice_ = self.phase1
+        self.best = None
+        self.lastDepth = None
+        if depths is None:
+            depths = range(self.maxLength + 1)
+        for depth in depths:
+            self.depth = depth
+            if depth > self._limit() or self._isDone():
+                break
+            self._phase1(twist, flip, slice_, depth, [], firstMoves)
+        return self.best
+
+    def _limit(self):
+        # Longest total solution still worth finding
+        if self.best is None:
+            return self.maxLength
+        return len(self.best) - 1
+
+    def _isDone(self):
+        # Whether to stop searching, with what's been found so far. The
+        # phase 1 lengths up to lastDepth (set when the first solution is
+        # found) are always searched in full.
+        if self.best is None or self.depth <= self.lastDepth:
+            return False
+        return len(self.best) <= self.targetLength or \
+            (self.maxNodes is not None and self.nodes >= self.maxNodes)
+
+    def _phase1(self, twist, flip, slice_, depth, moves, firstMoves=None):
+        # Returns True to stop the search early (when nothing shorter can
+        # be found, or what's been found is good enough).
+        self.nodes += 1
+        t = self.tables
+        index = twist * NUM_SLICES + slice_
+        flipIndex = flip * NUM_SLICES + slice_
+        bound = max(t.twistSlicePrune[index], t.flipSlicePrune[flipIndex])
+        if bound > depth:
+            return False
+        if depth == 0:
+            # In G1. Unless this is the start, the last move must not be a
+            # phase 2 move, or we'd have found this solution at the previous
+            # depth.
+            if moves and moves[-1] in self.phase2Index:
+                return False
+            solution = self._startPhase2(moves)
+            if solution is not None:
+                if self.best is None:
+                    self.lastDepth = self.depth + self.extraDepth
+                self.best = solution
+            return self._limit() < len(moves) or self._isDone()
+
+        lastMove = moves[-1] if moves else None
+        candidates = _allowedMoves(lastMove, range(NUM_MOVES))
+        if firstMoves is not None:
+            candidates = [m for m in candidates if m in firstMoves]
+        for m in candidates:
+            moves.append(m)
+            done = self._phase1(
+                t.twistMove[twist * NUM_MOVES + m],
+                t.flipMove[flip * NUM_MOVES + m],
+                t.sliceMove[slice_ * NUM_MOVES + m],
+                depth - 1, moves)
+            moves.pop()
+            if done or self._isDone():
+                return True
+        return False
+
+    def _startPhase2(self, phase1Moves):
+        cornerPerm = self.cornerPerm
+        edgePerm = self.edgePerm
+        for m in phase1Moves:
+            movePerm = self.moveCornerPerms[m]
+            cornerPerm = [cornerPerm[i] for i in movePerm]
+            movePerm = self.moveEdgePerms[m]
+            edgePerm = [edgePerm[i] for i in movePerm]
+        cornerCoord = int(encodePerm(np.array(cornerPerm)))
+        udEdgeCoord = int(encodePerm(np.array(edgePerm[:8])))
+        sliceCoord = int(encodePerm(np.array(edgePerm[8:]) - 8))
+
+        lastMove = phase1Moves[-1] if phase1Moves else None
+        for depth in range(self._limit() - len(phase1Moves) + 1):
+            moves = self._phase2(cornerCoord, udEdgeCoord, sliceCoord, depth,
+                lastMove, [])
+            if moves is not None:
+                return phase1Moves + moves
+        return None
+
+    def _phase2(self, corner, edge, slice_, depth, lastMove, moves):
+        self.nodes += 1
+        t = self.tables
+        bound = max(t.cornerSlicePrune[corner * NUM_SLICE_PERMS + slice_],
+            t.edgeSlicePrune[edge * NUM_SLICE_PERMS + slice_])
+        if bound > depth:
+            return None
+        if depth == 0:
+            return list(moves)
+        numMoves = len(_phase2Moves)
+        for m in _allowedMoves(lastMove, _phase2Moves):
+            i = self.phase2Index[m]
+            moves.append(m)
+            solution = self._phase2(
+                t.cornerPermMove[corner * numMoves + i],
+                t.udEdgePermMove[edge * numMoves + i],
+                t.slicePermMove[slice_ * numMoves + i],
+                depth - 1, m, moves)
+            moves.pop()
+            if solution is not None:
+                return solution
+        return None
+
+
+########################################
+# Parallel solving
+#
+# Workers load the tables in their initializer. The parent makes sure
+# they're on disk before starting any workers, so every worker just maps the
+# same files and they all share one copy of the pages.
+
+def _initWorker():
+    getTables()
+
+def _solveOne(index, scramble, options):
+    result = {
+        "index"    : index,
+        "scramble" : scramble,
+        "solution" : None,
+        "length"   : None,
+        "error"    : None,
+    }
+    try:
+        solution = solve(scramble, **options)
+    except ValueError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    if solution is not None:
+        result["solution"] = solution
+        result["length"] = len(solution.split())
+    return result
+
+def solveBatch(scrambles, workers=None, **options):
+    '''
+    Solve each scramble (a string) across a pool of worker processes,
+    yielding a result dict for each one as soon as it is done, so usually not
+    in the order given; each result has the scramble's "index" in the input.
+    Scrambles are read lazily, with only a few per worker in flight. Any
+    other keyword arguments are passed on to solve.
+    '''
+    getTables()
+    if workers == 1:
+        for index, scramble in enumerate(scrambles):
+            yield _solveOne(index, scramble, options)
+        return
+
+    maxPending = 4 * (workers or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(workers,
+            initializer=_initWorker) as executor:
+        pending = set()
+        for index, scramble in enumerate(scrambles):
+            pending.add(executor.submit(_solveOne, index, scramble,
+                options))
+            if len(pending) >= maxPending:
+                done, pending = concurrent.futures.wait(pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+def _solveBranch(pieces, firstMoves, depth, maxLength, targetLength):
+    # Returns (moves or None, number of nodes visited).
+    search = _Search(getTables(), CompactCube(pieces), maxLength, 0,
+        targetLength, None)
+    return search.run(firstMoves, depths=[depth]), search.nodes
+
+def solveParallel(cube, workers=None, maxLength=DEFAULT_MAX_LENGTH,
+        extraDepth=0, targetLength=DEFAULT_TARGET_LENGTH,
+        maxNodes=DEFAULT_MAX_NODES):
+    '''
+    Like solve, but for one hard cube: each phase 1 length is searched by
+    splitting it up by the first move, with the branches running in worker
+    processes, and the shortest solution any branch finds wins. Finds about
+    the same length of solution as solve, sooner on several cores; the node
+    budget is only checked between phase 1 lengths, and counts the nodes of
+    every branch.
+    '''
+    if isinstance(cube, str):
+        cube = _cubeAfter(cube)
+    compact = CompactCube.fromCube(cube)
+    getTables()
+    best = None
+    lastDepth = None
+    nodes = 0
+    with concurrent.futures.ProcessPoolExecutor(workers,
+            initializer=_initWorker) as executor:
+        for depth in range(maxLength + 1):
+            limit = maxLength if best is None else len(best) - 1
+            if depth > limit:
+                break
+            if best is not None and depth > lastDepth and (
+                    len(best) <= targetLength or
+                    (maxNodes is not None and nodes >= maxNodes)):
+                break
+            # A phase 1 of length 0 has no first move to split on.
+            branches = [None] if depth == 0 else \
+                [[m] for m in range(NUM_MOVES)]
+            futures = {executor.submit(_solveBranch, compact.pieces,
+                    firstMoves, depth, limit, targetLength): i
+                for i, firstMoves in enumerate(branches)}
+            # Break ties by branch, so the answer doesn't depend on timing.
+            found = []
+            for future in concurrent.futures.as_completed(futures):
+                moves, branchNodes = future.result()
+                nodes += branchNodes
+                if moves is not None:
+                    found.append((len(moves), futures[future], moves))
+            if found and (best is None or min(found)[0] < len(best)):
+                best = min(found)[2]
+            if best is not None and lastDepth is None:
+                lastDepth = depth + extraDepth
+    return _movesToString(cube, best)
+
+def batchMain(path, workers, **options):
+    numSolved = 0
+    numScrambles = 0
+    for result in solveBatch(readLines(path), workers, **options):
+        print(json.dumps(result), flush=True)
+        numScrambles += 1
+        numSolved += result["solution"] is not None
+    print(f"{numSolved} of {numScrambles} solved", file=sys.stderr)
+
+
+########################################
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+'''
+Precomputed tables, built once and kept on disk as .npy files.
+
+Tables are loaded memory-mapped and read-only, so loading is nearly instant
+and every process using the same table shares one copy of its pages.
+'''
+
+import logging
+import os
+import zlib
+
+import numpy as np
+
+# Set this environment variable to keep the tables somewhere other than the
+# default cache directory.
+TABLE_DIR_ENV = 'CUBE_TABLE_DIR'
+
+def tableDir():
+    path = os.environ.get(TABLE_DIR_ENV)
+    if path:
+        return path
+    cacheHome = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cacheHome, 'ruby-cube')
+
+def inputsDigest(inputs):
+    '''
+    Return a short digest of the data a table is built from, for telling
+    apart tables built from different data. inputs can be anything whose repr
+    shows all of it: numbers, strings, and lists, tuples and dicts of them.
+    '''
+    # A CRC is plenty to tell apart a handful of versions of the same table,
+    # and zlib is much quicker to import than hashlib.
+    return f'{zlib.crc32(repr(inputs).encode()):08x}'
+
+def tablePath(name, version, inputs=None):
+    if inputs is None:
+        return os.path.join(tableDir(), f'{name}-v{version}.npy')
+    return os.path.join(tableDir(),
+        f'{name}-v{version}-{inputsDigest(inputs)}.npy')
+
+_logger = logging.getLogger(__name__)
+
+# Whether a table couldn't be saved yet in this process. Only the first
+# failure is reported, since the rest are almost always for the same reason.
+_saveFailed = False
+
+def _loadExisting(path, shape, dtype):
+    # The table saved at path, or None if there isn't one that matches the
+    # expected shape and dtype.
+    try:
+        table = np.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        _logger.info('Rebuilding unreadable table %s: %s', path, e)
+        return None
+    if table.shape != shape or table.dtype != dtype:
+        _logger.info('Rebuilding table %s: expected %s %s, found %s %s',
+            path, shape, dtype, table.shape, table.dtype)
+        return None
+    return table
+
+def loadTable(name, version, build, shape, dtype, inputs=None):
+    '''
+    Return the table with the given name and version, memory-mapped from the
+    cache directory. If it isn't there yet, call build() to make it (an
+    array, which is converted to dtype and must have the given shape) and
+    save it first. Bump version whenever build would produce something
+    different, so that stale files are never picked up; a file that doesn't
+    have the expected shape and dtype is rebuilt and replaced.
+
+    inputs, if given, is the data that build works from, such as move
+    definitions (see inputsDigest). It goes into the file name, so a table
+    is rebuilt when its data changes, without bumping the version.
+
+    If the table can't be saved, the freshly built array is returned
+    instead, and a warning is logged (once per process).
+    '''
+    global _saveFailed
+    path = tablePath(name, version, inputs)
+    shape = tuple(shape)
+    dtype = np.dtype(dtype)
+    table = _loadExisting(path, shape, dtype)
+    if table is not None:
+        return table
+
+    table = np.ascontiguousarray(build(), dtype=dtype)
+    if table.shape != shape:
+        raise ValueError(f'Table {name} was built with shape {table.shape}, '
+            f'expected {shape}')
+    # Only imported when needed, since it's slow to import and most runs
+    # find their tables already built.
+    import tempfile
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename it into place, so that other
+        # processes never see a partly written table. If several of them
+        # build the same table at once, the last rename wins, which is fine.
+        fd, tempPath = tempfile.mkstemp(dir=os.path.dirname(path),
+            prefix=os.path.basename(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, table)
+            # mkstemp makes the file private; let other users share it.
+            os.chmod(tempPath, 0o644)
+            os.replace(tempPath, path)
+        except BaseException:
+            os.unlink(tempPath)
+            raise
+    except OSError as e:
+        if not _saveFailed:
+            _saveFailed = True
+            _logger.warning('Could not save table %s (tables will be '
+                'rebuilt on every run): %s', path, e)
+        return table
+    return np.load(path, mmap_mode='r')